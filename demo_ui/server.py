@@ -1,21 +1,31 @@
 #!/usr/bin/env python3
 import argparse
+import atexit
 import base64
-import json
+import hashlib
+import mimetypes
 import os
 import queue
+import selectors
 import subprocess
 import sys
 import threading
 import time
 import uuid
+from itertools import islice
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import asdict, dataclass, field
+from functools import lru_cache
 from datetime import datetime, timezone
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Any
-from urllib.parse import parse_qs, urlparse
+from typing import Any, Callable, Iterator
+from urllib.parse import parse_qs, quote, urlparse
+
+import orjson
 
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
@@ -26,22 +36,23 @@ STATE_DIR = Path(__file__).resolve().parent / ".state"
 def load_dotenv_if_present(path: Path) -> None:
     if not path.exists():
         return
-    for raw in path.read_text(encoding="utf-8", errors="ignore").splitlines():
-        line = raw.strip()
-        if not line or line.startswith("#"):
-            continue
-        if line.startswith("export "):
-            line = line.removeprefix("export ").strip()
-        if "=" not in line:
-            continue
-        key, value = line.split("=", 1)
-        key = key.strip()
-        value = value.strip().strip('"').strip("'")
-        if not key:
-            continue
-        if key in os.environ:
-            continue
-        os.environ[key] = value
+    with path.open(encoding="utf-8", errors="ignore") as handle:
+        for raw in handle:
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("export "):
+                line = line.removeprefix("export ").strip()
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip()
+            value = value.strip().strip('"').strip("'")
+            if not key:
+                continue
+            if key in os.environ:
+                continue
+            os.environ[key] = value
 
 
 # Load `.env` (gitignored) so demo UI works without manual `export ...`
@@ -55,7 +66,74 @@ def now_iso() -> str:
 
 
 def json_bytes(payload: Any) -> bytes:
-    return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    return orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def tail_lines(path: Path, n: int, chunk_size: int = 64 * 1024) -> tuple[list[str], int]:
+    """Return the last `n` complete lines of a text file and the byte offset just past them."""
+    chunks: list[bytes] = []
+    newlines = 0
+    with path.open("rb") as handle:
+        pos = handle.seek(0, os.SEEK_END)
+        # One extra newline guarantees the first kept line is complete.
+        while pos > 0 and newlines <= n:
+            step = min(chunk_size, pos)
+            pos -= step
+            handle.seek(pos)
+            chunk = handle.read(step)
+            newlines += chunk.count(b"\n")
+            chunks.append(chunk)
+    data = b"".join(reversed(chunks))
+    # A trailing line still being written is left for the next read.
+    cut = data.rfind(b"\n") + 1
+    lines = data[:cut].decode("utf-8", errors="ignore").splitlines()
+    return (lines[-n:] if n > 0 else []), pos + cut
+
+
+def end_log_line(log_fd: int, log_path: Path) -> None:
+    """Newline-terminate a finished log; readers only ever return complete lines."""
+    end = os.lseek(log_fd, 0, os.SEEK_CUR)
+    if end == 0:
+        return
+    with log_path.open("rb") as handle:
+        handle.seek(end - 1)
+        if handle.read(1) != b"\n":
+            os.write(log_fd, b"\n")
+
+
+# Incremental log reads past this many new bytes fall back to a plain tail.
+LOG_DELTA_MAX = 1024 * 1024
+# `/api/log/stream` checks the log size this often and pings idle clients.
+LOG_STREAM_INTERVAL = 0.5
+LOG_STREAM_PING = 15.0
+FINISHED_STATUSES = frozenset({"success", "failed", "stopped"})
+
+
+def read_lines_since(path: Path, offset: int, n: int) -> tuple[list[str], int] | None:
+    """Return complete lines written after byte `offset`, or None if a full tail is needed."""
+    with path.open("rb") as handle:
+        size = handle.seek(0, os.SEEK_END)
+        if offset > size or size - offset > LOG_DELTA_MAX:
+            return None
+        handle.seek(offset)
+        data = handle.read(size - offset)
+    cut = data.rfind(b"\n") + 1
+    lines = data[:cut].decode("utf-8", errors="ignore").splitlines()
+    return (lines[-n:] if n > 0 else []), offset + cut
+
+
+def list_json_names(root: Path, limit: int = 1000) -> list[str]:
+    """Sorted names of the `.json` files directly under `root`, without building Paths."""
+    with os.scandir(root) as it:
+        names = [e.name for e in it if e.name.endswith(".json") and e.is_file()]
+    names.sort()
+    return names[:limit]
 
 
 def safe_join(root: Path, rel: str) -> Path:
@@ -73,7 +151,16 @@ ALLOWED_READ_DIRS = {
     "transcripts_clean": REPO_ROOT / "transcripts_clean",
 }
 
-ALLOWED_AUDIO_EXTS = {".wav", ".mp3", ".m4a", ".flac"}
+ALLOWED_AUDIO_EXTS = frozenset({".wav", ".mp3", ".m4a", ".flac"})
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=1024)
+def is_audio_name(name: str) -> bool:
+    """Same rule as `Path(name).suffix.lower() in ALLOWED_AUDIO_EXTS`, on the bare string."""
+    stem, _, ext = name.rpartition(".")
+    return bool(stem) and bool(ext) and f".{ext.lower()}" in ALLOWED_AUDIO_EXTS
 
 
 WHITELIST_TASKS: dict[str, list[str]] = {
@@ -115,64 +202,302 @@ class Run:
     log_path: str | None = None
 
 
+class RWLock:
+    """Writer-preferring readers-writer lock: many readers or a single writer."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class BatchedAppender:
+    """Append-only JSONL file: `append` only queues bytes, a daemon thread writes them in batches."""
+
+    def __init__(self, path: Path, interval: float = 0.2, max_batch_bytes: int = 64 * 1024) -> None:
+        self.path = path
+        self.interval = interval
+        self.max_batch_bytes = max_batch_bytes
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        self._pending: deque[bytes] = deque()
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def append(self, line: bytes) -> None:
+        with self._lock:
+            self._pending.append(line)
+            self._pending_bytes += len(line)
+            full = self._pending_bytes >= self.max_batch_bytes
+        if full:
+            self._wake.set()
+
+    def flush(self) -> None:
+        with self._io_lock:
+            self._drain()
+
+    def compact(self, write_snapshot: Callable[[], None]) -> None:
+        """Write a snapshot covering everything appended so far, then empty the file."""
+        with self._io_lock:
+            self._drain()
+            write_snapshot()
+            os.ftruncate(self._fd, 0)
+
+    def _drain(self) -> None:
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+            self._pending_bytes = 0
+        if batch:
+            try:
+                _write_all(self._fd, batch)
+            except OSError:
+                # Keep the lines for the next attempt rather than dropping them.
+                with self._lock:
+                    self._pending.extendleft(reversed(batch))
+                    self._pending_bytes += sum(len(line) for line in batch)
+                raise
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError as exc:
+                print(f"[demo_ui] journal write to {self.path} failed: {exc}", file=sys.stderr)
+
+
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+
+def _write_all(fd: int, chunks: list[bytes]) -> None:
+    if not hasattr(os, "writev"):
+        data = b"".join(chunks)
+        while data:
+            data = data[os.write(fd, data):]
+        return
+    for start in range(0, len(chunks), _IOV_MAX):
+        group = chunks[start : start + _IOV_MAX]
+        written = os.writev(fd, group)
+        if written < sum(len(c) for c in group):
+            rest = b"".join(group)[written:]
+            while rest:
+                rest = rest[os.write(fd, rest):]
+
+
+# Runs are split into shards with their own locks so `/api/log` polls for one
+# run never wait on the Runner updating another.
+RUN_SHARDS = 16  # power of two: shard index is a mask of the id hash
+# Mutations only mark state dirty; background flushers coalesce them into one
+# atomic rewrite of `runs_state.json` / `sessions.json` per interval. Session
+# changes are also journaled as they happen, so their snapshot can lag more.
+RUNS_FLUSH_INTERVAL = 1.0
+SESSIONS_FLUSH_INTERVAL = 5.0
+
+
 class StateStore:
     def __init__(self, root: Path) -> None:
         self.root = root
         self.sessions_path = root / "sessions.json"
+        self.sessions_log_path = root / "sessions.jsonl"
         self.runs_path = root / "runs.jsonl"
+        self.runs_state_path = root / "runs_state.json"
         self.feedback_path = root / "feedback.jsonl"
-        self._lock = threading.Lock()
+        self._lock = RWLock()
+        self._io_lock = threading.Lock()
         self.sessions: dict[str, Session] = {}
-        self.runs: dict[str, Run] = {}
+        self._run_shards: list[dict[str, Run]] = [{} for _ in range(RUN_SHARDS)]
+        self._run_locks = [RWLock() for _ in range(RUN_SHARDS)]
+        # Encoded JSON per run, dropped on update, so `/api/runs` polls reuse bytes.
+        self._run_json: list[dict[str, bytes]] = [{} for _ in range(RUN_SHARDS)]
+        self._runs_dirty = threading.Event()
+        self._sessions_dirty = threading.Event()
+        # Run ids newest-first, so listing costs O(limit) instead of a full sort.
+        self._runs_global: deque[str] = deque()
+        self._runs_by_session: dict[str, deque[str]] = {}
+        self._sessions_order: deque[str] = deque()
         self._load()
+        self._index_runs()
+        self._runs_log = BatchedAppender(self.runs_path)
+        self._feedback_log = BatchedAppender(self.feedback_path)
+        self._sessions_log = BatchedAppender(self.sessions_log_path)
+        for dirty, write, interval in (
+            (self._runs_dirty, self.compact_runs, RUNS_FLUSH_INTERVAL),
+            (self._sessions_dirty, self.compact_sessions, SESSIONS_FLUSH_INTERVAL),
+        ):
+            threading.Thread(target=self._flusher, args=(dirty, write, interval), daemon=True).start()
+
+    def _shard(self, run_id: str) -> int:
+        return hash(run_id) & (RUN_SHARDS - 1)
+
+    @staticmethod
+    def _session_from(item: dict[str, Any]) -> Session:
+        return Session(
+            id=item.get("id", ""),
+            created_at=item.get("created_at", now_iso()),
+            name=item.get("name", "Session"),
+            notes=item.get("notes", ""),
+            audio_files=item.get("audio_files") or [],
+        )
 
     def _load(self) -> None:
         if self.sessions_path.exists():
-            payload = json.loads(self.sessions_path.read_text(encoding="utf-8"))
-            for item in payload:
-                sess = Session(
-                    id=item.get("id", ""),
-                    created_at=item.get("created_at", now_iso()),
-                    name=item.get("name", "Session"),
-                    notes=item.get("notes", ""),
-                    audio_files=item.get("audio_files") or [],
-                )
+            for item in orjson.loads(self.sessions_path.read_bytes()):
+                sess = self._session_from(item)
                 self.sessions[sess.id] = sess
+        # `sessions.jsonl` holds full session records written since the snapshot;
+        # the last line for an id wins.
+        if self.sessions_log_path.exists():
+            with self.sessions_log_path.open("rb") as handle:
+                for line in handle:
+                    line = line.strip()
+                    if line:
+                        sess = self._session_from(orjson.loads(line))
+                        self.sessions[sess.id] = sess
+                        self._sessions_dirty.set()  # fold the journal into the next snapshot
+        ordered = sorted(self.sessions.values(), key=lambda s: s.created_at, reverse=True)
+        self._sessions_order.extend(s.id for s in ordered)
+        # `runs_state.json` holds the latest state of every run; `runs.jsonl` is
+        # a journal of runs created since that snapshot and is emptied each time
+        # a new one is written, so startup cost tracks live runs, not history.
+        snapshot_ids: set[str] = set()
+        if self.runs_state_path.exists():
+            try:
+                for item in orjson.loads(self.runs_state_path.read_bytes()):
+                    run = Run(**item)
+                    self._run_shards[self._shard(run.id)][run.id] = run
+                    snapshot_ids.add(run.id)
+            except (orjson.JSONDecodeError, TypeError):
+                snapshot_ids.clear()
+                self._run_shards = [{} for _ in range(RUN_SHARDS)]
         if self.runs_path.exists():
-            for line in self.runs_path.read_text(encoding="utf-8").splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                item = json.loads(line)
-                run = Run(**item)
-                self.runs[run.id] = run
+            with self.runs_path.open("rb") as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    item = orjson.loads(line)
+                    if item.get("id") in snapshot_ids:
+                        continue
+                    run = Run(**item)
+                    self._run_shards[self._shard(run.id)][run.id] = run
 
-    def _persist_sessions(self) -> None:
-        self.sessions_path.write_text(json.dumps([asdict(s) for s in self.sessions.values()], ensure_ascii=False, indent=2), encoding="utf-8")
+    def _write_sessions(self) -> None:
+        with self._lock.read():
+            payload = orjson.dumps(list(self.sessions.values()), option=orjson.OPT_INDENT_2)
+        with self._io_lock:
+            atomic_write_bytes(self.sessions_path, payload)
 
     def _append_run(self, run: Run) -> None:
-        with self.runs_path.open("a", encoding="utf-8") as handle:
-            handle.write(json.dumps(asdict(run), ensure_ascii=False))
-            handle.write("\n")
+        # orjson serializes dataclasses natively, which skips asdict's deep copy.
+        self._runs_log.append(orjson.dumps(run) + b"\n")
+
+    def _index_runs(self) -> None:
+        runs: list[Run] = []
+        for shard in self._run_shards:
+            runs.extend(shard.values())
+        runs.sort(key=lambda r: r.created_at)
+        for run in runs:
+            self._runs_global.appendleft(run.id)
+            self._runs_by_session.setdefault(run.session_id, deque()).appendleft(run.id)
+
+    def _write_runs_snapshot(self) -> None:
+        # Each shard is encoded under its own read lock; the JSON arrays are then
+        # spliced into one without decoding them again.
+        parts: list[bytes] = []
+        for lock, shard in zip(self._run_locks, self._run_shards):
+            with lock.read():
+                if shard:
+                    parts.append(orjson.dumps(list(shard.values()))[1:-1])
+        with self._io_lock:
+            atomic_write_bytes(self.runs_state_path, b"[" + b",".join(parts) + b"]")
+
+    def compact_runs(self) -> None:
+        self._runs_log.compact(self._write_runs_snapshot)
+
+    def compact_sessions(self) -> None:
+        self._sessions_log.compact(self._write_sessions)
+
+    def _journal_session(self, sess: Session) -> None:
+        self._sessions_log.append(orjson.dumps(sess) + b"\n")
+
+    def _flusher(self, dirty: threading.Event, write: Callable[[], None], interval: float) -> None:
+        while True:
+            dirty.wait()
+            dirty.clear()
+            try:
+                write()
+            except Exception as exc:  # noqa: BLE001
+                # A full disk or a removed .state/ must not end the thread: retry next interval.
+                print(f"[demo_ui] state flush failed: {exc}", file=sys.stderr)
+                dirty.set()
+            time.sleep(interval)
+
+    def flush(self) -> None:
+        self._runs_log.flush()
+        self._feedback_log.flush()
+        self._sessions_log.flush()
+        if self._runs_dirty.is_set():
+            self._runs_dirty.clear()
+            self.compact_runs()
+        if self._sessions_dirty.is_set():
+            self._sessions_dirty.clear()
+            self.compact_sessions()
 
     def create_session(self, name: str) -> Session:
-        with self._lock:
+        with self._lock.write():
             sess = Session(id=str(uuid.uuid4()), created_at=now_iso(), name=name)
             self.sessions[sess.id] = sess
-            self._persist_sessions()
-            return sess
+            self._sessions_order.appendleft(sess.id)
+            self._journal_session(sess)
+        self._sessions_dirty.set()
+        return sess
 
     def set_session_audio(self, session_id: str, files: list[str]) -> None:
-        with self._lock:
+        with self._lock.write():
             sess = self.sessions.get(session_id)
             if sess is None:
                 return
             sess.audio_files = files
-            self._persist_sessions()
+            self._journal_session(sess)
+        self._sessions_dirty.set()
 
     def list_sessions(self) -> list[Session]:
-        with self._lock:
-            return sorted(self.sessions.values(), key=lambda s: s.created_at, reverse=True)
+        with self._lock.read():
+            return [self.sessions[sid] for sid in self._sessions_order]
 
     def create_run(self, session_id: str, task: str, command: list[str]) -> Run:
         log_dir = self.root / "logs" / session_id
@@ -188,27 +513,58 @@ class StateStore:
             created_at=now_iso(),
             log_path=str(log_path),
         )
-        with self._lock:
-            self.runs[run.id] = run
-            self._append_run(run)
+        shard = self._shard(run.id)
+        with self._run_locks[shard].write():
+            self._run_shards[shard][run.id] = run
+        with self._lock.write():
+            self._runs_global.appendleft(run.id)
+            self._runs_by_session.setdefault(session_id, deque()).appendleft(run.id)
+        self._append_run(run)
+        self._runs_dirty.set()
         return run
 
     def update_run(self, run: Run) -> None:
-        with self._lock:
-            self.runs[run.id] = run
-            self._append_run(run)
+        shard = self._shard(run.id)
+        with self._run_locks[shard].write():
+            self._run_shards[shard][run.id] = run
+            self._run_json[shard].pop(run.id, None)
+        self._runs_dirty.set()
 
     def get_run(self, run_id: str) -> Run | None:
-        with self._lock:
-            return self.runs.get(run_id)
+        shard = self._shard(run_id)
+        with self._run_locks[shard].read():
+            return self._run_shards[shard].get(run_id)
+
+    def run_json(self, run_id: str) -> bytes | None:
+        shard = self._shard(run_id)
+        with self._run_locks[shard].read():
+            cached = self._run_json[shard].get(run_id)
+        if cached is not None:
+            return cached
+        with self._run_locks[shard].write():
+            run = self._run_shards[shard].get(run_id)
+            if run is None:
+                return None
+            cached = self._run_json[shard][run_id] = orjson.dumps(run)
+        return cached
+
+    def _list_run_ids(self, session_id: str | None, limit: int) -> list[str]:
+        with self._lock.read():
+            ids = self._runs_by_session.get(session_id, deque()) if session_id else self._runs_global
+            return list(islice(ids, max(limit, 0)))
 
     def list_runs(self, session_id: str | None = None, limit: int = 50) -> list[Run]:
-        with self._lock:
-            runs = list(self.runs.values())
-        if session_id:
-            runs = [r for r in runs if r.session_id == session_id]
-        runs.sort(key=lambda r: r.created_at, reverse=True)
-        return runs[:limit]
+        runs: list[Run] = []
+        for run_id in self._list_run_ids(session_id, limit):
+            run = self.get_run(run_id)
+            if run is not None:
+                runs.append(run)
+        return runs
+
+    def list_runs_json(self, session_id: str | None = None, limit: int = 50) -> bytes:
+        """`list_runs` as an encoded JSON array, spliced from the per-run cache."""
+        parts = [self.run_json(run_id) for run_id in self._list_run_ids(session_id, limit)]
+        return b"[" + b",".join(p for p in parts if p is not None) + b"]"
 
     def add_feedback(self, session_id: str | None, payload: dict[str, Any]) -> None:
         record = {
@@ -216,19 +572,35 @@ class StateStore:
             "session_id": session_id,
             **payload,
         }
-        with self.feedback_path.open("a", encoding="utf-8") as handle:
-            handle.write(json.dumps(record, ensure_ascii=False))
-            handle.write("\n")
+        self._feedback_log.append(orjson.dumps(record) + b"\n")
+
+
+PIPE_CHUNK_SIZE = 64 * 1024
+# On Linux, pipe output is spliced into the log inside the kernel and never
+# copied through Python; other platforms use an os.read/os.write loop.
+USE_SPLICE = hasattr(os, "splice")
+# Queued tasks run one at a time by default: pipeline steps queued in order
+# (rollup -> aggregate -> dedup -> kb) read the previous step's output. Raise
+# DEMO_UI_WORKERS only when the tasks being queued are independent.
+RUNNER_WORKERS = int(os.getenv("DEMO_UI_WORKERS", "1"))
 
 
 class Runner:
-    def __init__(self, store: StateStore) -> None:
+    """Run whitelisted tasks on a worker pool; one selector thread tees all their output."""
+
+    def __init__(self, store: StateStore, workers: int = RUNNER_WORKERS) -> None:
         self.store = store
         self.queue: "queue.Queue[str]" = queue.Queue()
-        self.processes: dict[str, subprocess.Popen[str]] = {}
+        self.processes: dict[str, subprocess.Popen[bytes]] = {}
         self._lock = threading.Lock()
-        t = threading.Thread(target=self._worker, daemon=True)
-        t.start()
+        # (pipe fd, log fd, done) registrations handed to the pump thread, which
+        # is woken through a self-pipe so it alone ever touches the selector.
+        self._pending: "queue.Queue[tuple[int, int, threading.Event]]" = queue.Queue()
+        self._wake_r, self._wake_w = os.pipe()
+        self._splice = USE_SPLICE
+        threading.Thread(target=self._pump, daemon=True).start()
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._worker, daemon=True).start()
 
     def enqueue(self, run_id: str) -> None:
         self.queue.put(run_id)
@@ -244,67 +616,274 @@ class Runner:
         except Exception:
             return False
 
+    def _pump(self) -> None:
+        sel = selectors.DefaultSelector()
+        sel.register(self._wake_r, selectors.EVENT_READ)
+        while True:
+            for key, _ in sel.select():
+                if key.fd == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    while True:
+                        try:
+                            pipe_fd, log_fd, done = self._pending.get_nowait()
+                        except queue.Empty:
+                            break
+                        sel.register(pipe_fd, selectors.EVENT_READ, (log_fd, done))
+                    continue
+                log_fd, done = key.data
+                if self._forward(key.fd, log_fd):
+                    continue
+                sel.unregister(key.fd)
+                done.set()
+
+    def _forward(self, pipe_fd: int, log_fd: int) -> bool:
+        """Move one chunk from the pipe to the log; False once the pipe hits EOF."""
+        if self._splice:
+            try:
+                return os.splice(pipe_fd, log_fd, PIPE_CHUNK_SIZE, flags=os.SPLICE_F_MOVE) > 0
+            except OSError:
+                # Filesystems without splice support: copy through userspace from now on.
+                self._splice = False
+        try:
+            chunk = os.read(pipe_fd, PIPE_CHUNK_SIZE)
+        except OSError:
+            return False
+        if chunk:
+            os.write(log_fd, chunk)
+        return bool(chunk)
+
     def _worker(self) -> None:
         while True:
             run_id = self.queue.get()
             run = self.store.get_run(run_id)
             if run is None:
                 continue
-            run.status = "running"
-            run.started_at = now_iso()
-            self.store.update_run(run)
-
-            log_path = Path(run.log_path) if run.log_path else (STATE_DIR / "logs" / f"{run.id}.log")
-            log_path.parent.mkdir(parents=True, exist_ok=True)
-            with log_path.open("a", encoding="utf-8") as log:
-                log.write(f"[{now_iso()}] START {run.task}: {' '.join(run.command)}\n")
-                log.flush()
+            self._execute(run)
+
+    def _execute(self, run: Run) -> None:
+        run.status = "running"
+        run.started_at = now_iso()
+        self.store.update_run(run)
+
+        log_path = Path(run.log_path) if run.log_path else (STATE_DIR / "logs" / f"{run.id}.log")
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        return_code: int | None = None
+        # splice() refuses O_APPEND targets, so position at the end explicitly;
+        # only this run ever writes to its log.
+        log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT, 0o666)
+        os.lseek(log_fd, 0, os.SEEK_END)
+        try:
+            os.write(log_fd, f"[{now_iso()}] START {run.task}: {' '.join(run.command)}\n".encode("utf-8"))
+            try:
                 proc = subprocess.Popen(
                     run.command,
                     cwd=str(REPO_ROOT),
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
-                    text=True,
-                    env={**os.environ},
+                    bufsize=0,
                 )
+            except OSError as exc:
+                os.write(log_fd, f"[{now_iso()}] ERROR {exc}\n".encode("utf-8"))
+            else:
                 with self._lock:
                     self.processes[run.id] = proc
                 try:
                     assert proc.stdout is not None
-                    for line in proc.stdout:
-                        log.write(line)
-                        log.flush()
+                    done = threading.Event()
+                    self._pending.put((proc.stdout.fileno(), log_fd, done))
+                    os.write(self._wake_w, b"\0")
+                    done.wait()
+                    end_log_line(log_fd, log_path)
                 finally:
                     return_code = proc.wait()
+                    proc.stdout.close()
                     with self._lock:
                         self.processes.pop(run.id, None)
+        finally:
+            os.fsync(log_fd)
+            os.close(log_fd)
 
-            run.return_code = return_code
-            run.finished_at = now_iso()
-            if return_code == 0:
-                run.status = "success"
-            elif return_code == -15:
-                run.status = "stopped"
-            else:
-                run.status = "failed"
-            self.store.update_run(run)
+        run.return_code = return_code
+        run.finished_at = now_iso()
+        if return_code == 0:
+            run.status = "success"
+        elif return_code == -15:
+            run.status = "stopped"
+        else:
+            run.status = "failed"
+        self.store.update_run(run)
 
 
 STORE = StateStore(STATE_DIR)
+atexit.register(STORE.flush)
 RUNNER = Runner(STORE)
 
 
+TASK_SERVER_SCRIPT = Path(__file__).resolve().parent / "task_server.py"
+# Tasks that need a fresh interpreter: GPU/model state, or a long-lived app.
+ISOLATED_TASKS = frozenset({"transcribe", "review_ui"})
+
+
+class TaskServer:
+    """Keeps `task_server.py serve` running so make targets fork from a warm interpreter."""
+
+    def __init__(self, sock_path: Path) -> None:
+        self.sock_path = sock_path
+        self.proc: subprocess.Popen[bytes] | None = None
+
+    def start(self) -> None:
+        if os.getenv("DEMO_UI_FORK_SERVER", "1") == "0":
+            return
+        self.sock_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.proc = subprocess.Popen(
+                [sys.executable, str(TASK_SERVER_SCRIPT), "serve", "--socket", str(self.sock_path)],
+                cwd=str(REPO_ROOT),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+            )
+        except OSError:
+            return
+        # Inherited by make and the client it runs as PY.
+        os.environ["DEMO_UI_TASK_SOCKET"] = str(self.sock_path)
+        atexit.register(self.stop)
+
+    def python_for(self, task: str) -> str:
+        if task in ISOLATED_TASKS or self.proc is None or self.proc.poll() is not None:
+            return sys.executable
+        return f"{sys.executable} {TASK_SERVER_SCRIPT}"
+
+    def stop(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+
+TASK_SERVER = TaskServer(STATE_DIR / "tasks.sock")
+
+
+STATIC_CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".svg": "image/svg+xml; charset=utf-8",
+}
+
+# path -> (mtime_ns, body, content type, etag); entries are refreshed when the file changes.
+_STATIC_CACHE: dict[str, tuple[int, bytes, str, str]] = {}
+_STATIC_LOCK = RWLock()
+
+
+def load_static(fp: Path) -> tuple[bytes, str, str] | None:
+    try:
+        st = fp.stat()
+    except OSError:
+        return None
+    if fp.is_dir():
+        return None
+    key = str(fp)
+    with _STATIC_LOCK.read():
+        cached = _STATIC_CACHE.get(key)
+    if cached is not None and cached[0] == st.st_mtime_ns:
+        return cached[1:]
+    body = fp.read_bytes()
+    ctype = STATIC_CONTENT_TYPES.get(fp.suffix) or mimetypes.guess_type(fp.name)[0] or "application/octet-stream"
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    with _STATIC_LOCK.write():
+        _STATIC_CACHE[key] = (st.st_mtime_ns, body, ctype, etag)
+    return body, ctype, etag
+
+
+def preload_static() -> None:
+    """Warm the static cache so the first page load does no disk reads."""
+    for fp in STATIC_DIR.rglob("*"):
+        if fp.is_file():
+            load_static(fp)
+
+
+# Assets under /static may be reused briefly without revalidation; index.html
+# always revalidates so a changed UI is picked up on the next reload.
+STATIC_MAX_AGE = 60
+
+
 class Handler(BaseHTTPRequestHandler):
     server_version = "LeasingDemoUI/0.1"
-
-    def _send(self, status: int, content_type: str, body: bytes) -> None:
+    # Persistent connections: the UI polls several endpoints every ~1s.
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections hand their thread back after this many seconds.
+    timeout = 30
+    # Small JSON responses go out at once instead of waiting on Nagle's algorithm.
+    disable_nagle_algorithm = True
+
+    def log_error(self, format: str, *args: Any) -> None:
+        if format.startswith("Request timed out"):
+            return  # an idle keep-alive connection expiring is routine
+        super().log_error(format, *args)
+
+    def _send(self, status: int, content_type: str, body: bytes, headers: dict[str, str] | None = None) -> None:
         self.send_response(status)
         self.send_header("Content-Type", content_type)
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("Cache-Control", "no-store")
+        # A 304 carries no entity, so it must not advertise one's length.
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        for key, value in {"Cache-Control": "no-store", **(headers or {})}.items():
+            self.send_header(key, value)
+        # Rejected uploads (and clients that asked for it) set close_connection first.
+        self.send_header("Connection", "close" if self.close_connection else "keep-alive")
         self.end_headers()
         self.wfile.write(body)
 
+    def _static(self, fp: Path, max_age: int = 0) -> None:
+        asset = load_static(fp)
+        if asset is None:
+            return self._send(404, "text/plain; charset=utf-8", b"Not found")
+        body, ctype, etag = asset
+        cache_control = f"public, max-age={max_age}" if max_age else "no-cache"
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, ctype, b"", headers)
+        return self._send(200, ctype, body, headers)
+
+    def _sse(self, event: str | None, payload: Any) -> None:
+        head = f"event: {event}\n".encode() if event else b""
+        self.wfile.write(head + b"data: " + orjson.dumps(payload) + b"\n\n")
+        self.wfile.flush()
+
+    def _stream_log(self, run_id: str, offset: int) -> None:
+        """Push lines appended to a run's log as server-sent events until the run ends."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        idle = 0.0
+        try:
+            while True:
+                run = STORE.get_run(run_id)
+                finished = run is None or run.status in FINISHED_STATUSES
+                fp = Path(run.log_path) if run is not None and run.log_path else None
+                # A size check is all an idle poll costs; the file is only read when it grew.
+                size = fp.stat().st_size if fp is not None and fp.exists() else offset
+                if size != offset:
+                    delta = read_lines_since(fp, offset, sys.maxsize)
+                    if delta is None:
+                        # Too far behind (or truncated): the client reloads the tail.
+                        return self._sse("refresh", {})
+                    lines, offset = delta
+                    if lines:
+                        self._sse(None, {"lines": lines, "offset": offset})
+                        idle = 0.0
+                if finished:
+                    return self._sse("end", {"status": run.status if run else None})
+                if idle >= LOG_STREAM_PING:
+                    self.wfile.write(b": ping\n\n")
+                    self.wfile.flush()
+                    idle = 0.0
+                time.sleep(LOG_STREAM_INTERVAL)
+                idle += LOG_STREAM_INTERVAL
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
     def _json(self, status: int, payload: Any) -> None:
         self._send(status, "application/json; charset=utf-8", json_bytes(payload))
 
@@ -314,26 +893,15 @@ class Handler(BaseHTTPRequestHandler):
     def _read_json(self) -> dict[str, Any]:
         length = int(self.headers.get("Content-Length") or "0")
         raw = self.rfile.read(length) if length else b"{}"
-        return json.loads(raw.decode("utf-8"))
+        return orjson.loads(raw)
 
     def do_GET(self) -> None:  # noqa: N802
         parsed = urlparse(self.path)
         if parsed.path == "/":
-            body = (STATIC_DIR / "index.html").read_bytes()
-            return self._send(200, "text/html; charset=utf-8", body)
+            return self._static(STATIC_DIR / "index.html")
         if parsed.path.startswith("/static/"):
             rel = parsed.path.removeprefix("/static/")
-            fp = safe_join(STATIC_DIR, rel)
-            if not fp.exists() or fp.is_dir():
-                return self._send(404, "text/plain; charset=utf-8", b"Not found")
-            ctype = "application/octet-stream"
-            if fp.suffix == ".js":
-                ctype = "application/javascript; charset=utf-8"
-            elif fp.suffix == ".css":
-                ctype = "text/css; charset=utf-8"
-            elif fp.suffix == ".svg":
-                ctype = "image/svg+xml; charset=utf-8"
-            return self._send(200, ctype, fp.read_bytes())
+            return self._static(safe_join(STATIC_DIR, rel), STATIC_MAX_AGE)
 
         if parsed.path == "/api/health":
             return self._json(200, {"ok": True, "ts": now_iso()})
@@ -343,8 +911,8 @@ class Handler(BaseHTTPRequestHandler):
         if parsed.path == "/api/runs":
             qs = parse_qs(parsed.query)
             session_id = (qs.get("session_id") or [None])[0]
-            runs = [asdict(r) for r in STORE.list_runs(session_id=session_id)]
-            return self._json(200, {"runs": runs})
+            runs = STORE.list_runs_json(session_id=session_id)
+            return self._send(200, "application/json; charset=utf-8", b'{"runs":' + runs + b"}")
         if parsed.path == "/api/tasks":
             return self._json(200, {"tasks": sorted(WHITELIST_TASKS.keys())})
         if parsed.path == "/api/env":
@@ -359,16 +927,26 @@ class Handler(BaseHTTPRequestHandler):
             audio_dir = REPO_ROOT / "audio"
             audio_dir.mkdir(parents=True, exist_ok=True)
             files: list[dict[str, Any]] = []
-            for p in sorted(audio_dir.iterdir()):
-                if not p.is_file():
+            with os.scandir(audio_dir) as it:
+                entries = sorted(it, key=lambda e: e.name)
+            for entry in entries:
+                if not is_audio_name(entry.name):
                     continue
-                if p.suffix.lower() not in ALLOWED_AUDIO_EXTS:
+                if not entry.is_file():
                     continue
-                st = p.stat()
-                files.append({"name": p.name, "size": st.st_size, "mtime": int(st.st_mtime)})
+                st = entry.stat()
+                files.append({"name": entry.name, "size": st.st_size, "mtime": int(st.st_mtime)})
             return self._json(200, {"files": files})
         if parsed.path == "/api/metrics":
             return self._json(200, {"metrics": compute_metrics()})
+        if parsed.path == "/api/log/stream":
+            qs = parse_qs(parsed.query)
+            run_id = (qs.get("run_id") or [None])[0]
+            if not run_id:
+                return self._bad("run_id required")
+            if STORE.get_run(run_id) is None:
+                return self._bad("unknown run_id", 404)
+            return self._stream_log(run_id, int((qs.get("since") or ["0"])[0]))
         if parsed.path == "/api/log":
             qs = parse_qs(parsed.query)
             run_id = (qs.get("run_id") or [None])[0]
@@ -379,10 +957,15 @@ class Handler(BaseHTTPRequestHandler):
                 return self._bad("unknown run_id", 404)
             fp = Path(run.log_path)
             if not fp.exists():
-                return self._json(200, {"lines": []})
+                return self._json(200, {"lines": [], "offset": 0, "append": False})
             limit = int((qs.get("limit") or ["300"])[0])
-            lines = fp.read_text(encoding="utf-8", errors="ignore").splitlines()[-limit:]
-            return self._json(200, {"lines": lines})
+            since = (qs.get("since") or [None])[0]
+            delta = read_lines_since(fp, int(since), limit) if since is not None else None
+            if delta is not None:
+                lines, offset = delta
+                return self._json(200, {"lines": lines, "offset": offset, "append": True})
+            lines, offset = tail_lines(fp, limit)
+            return self._json(200, {"lines": lines, "offset": offset, "append": False})
         if parsed.path == "/api/files":
             qs = parse_qs(parsed.query)
             kind = (qs.get("kind") or [None])[0]
@@ -391,8 +974,7 @@ class Handler(BaseHTTPRequestHandler):
             root = ALLOWED_READ_DIRS[kind]
             if not root.exists():
                 return self._json(200, {"files": []})
-            files = sorted([p.name for p in root.glob("*.json")])[:1000]
-            return self._json(200, {"files": files})
+            return self._json(200, {"files": list_json_names(root)})
         if parsed.path == "/api/file":
             qs = parse_qs(parsed.query)
             kind = (qs.get("kind") or [None])[0]
@@ -405,13 +987,53 @@ class Handler(BaseHTTPRequestHandler):
                 return self._bad("not found", 404)
             if fp.suffix != ".json":
                 return self._bad("only .json allowed", 400)
-            text = fp.read_text(encoding="utf-8", errors="ignore")
-            return self._json(200, {"name": name, "text": text})
+            # Forward the file as-is instead of re-encoding it as a JSON string.
+            return self._send(
+                200,
+                "application/json; charset=utf-8",
+                fp.read_bytes(),
+                {"X-File-Name": quote(name)},
+            )
 
         return self._send(404, "text/plain; charset=utf-8", b"Not found")
 
+    def _upload_audio(self, parsed: Any) -> None:
+        """Stream a raw `application/octet-stream` body into `audio/<name>`."""
+        qs = parse_qs(parsed.query)
+        name = (qs.get("name") or [""])[0].strip()
+        length = int(self.headers.get("Content-Length") or "0")
+        # Rejections leave the body unread, so the connection cannot be reused.
+        if not name or "/" in name or "\\" in name:
+            self.close_connection = True
+            return self._bad("invalid name")
+        if not is_audio_name(name):
+            self.close_connection = True
+            return self._bad("unsupported audio type")
+        if not length or length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            return self._bad("empty or too large upload")
+        audio_dir = REPO_ROOT / "audio"
+        audio_dir.mkdir(parents=True, exist_ok=True)
+        tmp = audio_dir / f".{name}.part"
+        remaining = length
+        with tmp.open("wb") as out:
+            while remaining:
+                chunk = self.rfile.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                out.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            tmp.unlink(missing_ok=True)
+            self.close_connection = True
+            return self._bad("incomplete upload")
+        os.replace(tmp, audio_dir / name)
+        return self._json(200, {"ok": True, "saved": [name]})
+
     def do_POST(self) -> None:  # noqa: N802
         parsed = urlparse(self.path)
+        if parsed.path == "/api/audio/upload" and self.headers.get_content_type() == "application/octet-stream":
+            return self._upload_audio(parsed)
         try:
             payload = self._read_json()
         except Exception:
@@ -431,7 +1053,7 @@ class Handler(BaseHTTPRequestHandler):
                 return self._bad("invalid task")
             command = list(WHITELIST_TASKS[task])
             if command and command[0] == "make":
-                command = ["make", f"PY={sys.executable}", *command[1:]]
+                command = ["make", f"PY={TASK_SERVER.python_for(task)}", *command[1:]]
             run = STORE.create_run(session_id=session_id, task=task, command=command)
             RUNNER.enqueue(run.id)
             return self._json(200, {"run": asdict(run)})
@@ -451,10 +1073,9 @@ class Handler(BaseHTTPRequestHandler):
                     continue
                 if "/" in name or "\\" in name:
                     continue
-                p = audio_dir / name
-                if not p.exists():
+                if not is_audio_name(name):
                     continue
-                if p.suffix.lower() not in ALLOWED_AUDIO_EXTS:
+                if not (audio_dir / name).exists():
                     continue
                 cleaned.append(name)
             STORE.set_session_audio(session_id=session_id, files=cleaned)
@@ -474,7 +1095,7 @@ class Handler(BaseHTTPRequestHandler):
                 data_b64 = (item.get("data_base64") or "").strip()
                 if not name or "/" in name or "\\" in name:
                     continue
-                if Path(name).suffix.lower() not in ALLOWED_AUDIO_EXTS:
+                if not is_audio_name(name):
                     continue
                 if not data_b64:
                     continue
@@ -482,7 +1103,7 @@ class Handler(BaseHTTPRequestHandler):
                     raw = base64.b64decode(data_b64, validate=True)
                 except Exception:
                     continue
-                if len(raw) > 200 * 1024 * 1024:
+                if len(raw) > MAX_UPLOAD_BYTES:
                     continue
                 (audio_dir / name).write_bytes(raw)
                 saved.append(name)
@@ -506,74 +1127,196 @@ class Handler(BaseHTTPRequestHandler):
         return self._send(404, "text/plain; charset=utf-8", b"Not found")
 
 
-def compute_metrics(max_files: int = 5000) -> dict[str, Any]:
-    per_call_dir = REPO_ROOT / "insights_per_call"
-    files = sorted(per_call_dir.glob("*.json")) if per_call_dir.exists() else []
-    files = files[:max_files]
-
-    def norm_status(s: Any) -> str:
-        val = str(s or "").strip().lower()
-        if val in {"resolved", "fully_resolved", "solved"}:
-            return "resolved"
-        if val in {"partially_resolved", "partial", "partially"}:
-            return "partial"
-        if val in {"unresolved", "not_resolved", "not resolved", "failed"}:
-            return "unresolved"
-        return "unknown"
-
-    resolution = {"resolved": 0, "partial": 0, "unresolved": 0, "unknown": 0}
-    emotions: dict[str, int] = {}
-    quality_flags: dict[str, int] = {}
-    unresolved_reasons: dict[str, int] = {}
-
-    for fp in files:
+_METRICS_CACHE: dict[str, Any] = {"key": None, "value": None}
+_METRICS_LOCK = threading.Lock()
+# Per-file contributions plus running totals, so only new/changed files are parsed.
+METRICS_STATE_PATH = STATE_DIR / "metrics_state.json"
+_METRICS_STATE: dict[str, Any] | None = None
+
+
+def _stat_signature(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+_STATUS_MAP = {
+    "resolved": "resolved",
+    "fully_resolved": "resolved",
+    "solved": "resolved",
+    "partially_resolved": "partial",
+    "partial": "partial",
+    "partially": "partial",
+    "unresolved": "unresolved",
+    "not_resolved": "unresolved",
+    "not resolved": "unresolved",
+    "failed": "unresolved",
+}
+
+
+def norm_status(s: Any) -> str:
+    return _STATUS_MAP.get(str(s or "").strip().lower(), "unknown")
+
+
+def _file_contribution(fp: Path) -> dict[str, Any] | None:
+    """Parse one per-call JSON into the counters it adds to the metrics."""
+    try:
+        data = orjson.loads(fp.read_bytes())
+    except Exception:
+        return None
+    if not isinstance(data, dict):
+        return None
+    st = norm_status(data.get("resolution_status"))
+
+    emotion = ""
+    emo = data.get("emotions") or {}
+    if isinstance(emo, dict):
+        emotion = (emo.get("client") or "").strip().lower()
+
+    flags: list[str] = []
+    qf = data.get("quality_flags") or []
+    if isinstance(qf, list):
+        for x in qf:
+            if isinstance(x, str) and x.strip():
+                flags.append(x.strip())
+
+    reason = ""
+    if st in {"unresolved", "partial"}:
+        handoff = data.get("handoff")
+        if isinstance(handoff, str):
+            reason = handoff.strip()
+        elif isinstance(handoff, dict):
+            for k in ("reason", "type", "needed"):
+                v = handoff.get(k)
+                if isinstance(v, str) and v.strip():
+                    reason = v.strip()
+                    break
+        if not reason and isinstance(qf, list) and qf:
+            first = qf[0]
+            if isinstance(first, str) and first.strip():
+                reason = first.strip()
+        if not reason:
+            mi = data.get("main_issue")
+            if isinstance(mi, str) and mi.strip():
+                reason = mi.strip()
+
+    # A handful of distinct labels repeat across thousands of files; interning
+    # lets the counters hash and compare them by identity.
+    return {
+        "status": st,
+        "emotion": sys.intern(emotion),
+        "quality_flags": [sys.intern(flag) for flag in flags],
+        "reason": sys.intern(reason),
+    }
+
+
+_METRIC_COUNTERS = ("emotions", "quality_flags", "unresolved_reasons")
+# Below this many changed files a thread pool costs more than it saves.
+METRICS_PARALLEL_MIN = 16
+METRICS_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+def _apply_contribution(state: dict[str, Any], contrib: dict[str, Any] | None, delta: int) -> None:
+    if contrib is None:
+        return
+    state["resolution"][contrib["status"]] += delta
+    if contrib["emotion"]:
+        state["emotions"][contrib["emotion"]] += delta
+    if delta > 0:
+        state["quality_flags"].update(contrib["quality_flags"])
+    else:
+        state["quality_flags"].subtract(contrib["quality_flags"])
+    if contrib["reason"]:
+        state["unresolved_reasons"][contrib["reason"]] += delta
+
+
+def _prune_counters(state: dict[str, Any]) -> None:
+    for name in _METRIC_COUNTERS:
+        counts: Counter[str] = state[name]
+        for key in [k for k, v in counts.items() if v <= 0]:
+            del counts[key]
+
+
+def _load_metrics_state() -> dict[str, Any]:
+    state: dict[str, Any] = {"files": {}}
+    if METRICS_STATE_PATH.exists():
         try:
-            data = json.loads(fp.read_text(encoding="utf-8"))
-        except Exception:
-            continue
-        st = norm_status(data.get("resolution_status"))
-        resolution[st] = resolution.get(st, 0) + 1
-
-        emo = data.get("emotions") or {}
-        if isinstance(emo, dict):
-            client_emo = (emo.get("client") or "").strip().lower()
-            if client_emo:
-                emotions[client_emo] = emotions.get(client_emo, 0) + 1
-
-        qf = data.get("quality_flags") or []
-        if isinstance(qf, list):
-            for x in qf:
-                if isinstance(x, str) and x.strip():
-                    key = x.strip()
-                    quality_flags[key] = quality_flags.get(key, 0) + 1
-
-        if st in {"unresolved", "partial"}:
-            reason = ""
-            handoff = data.get("handoff")
-            if isinstance(handoff, str):
-                reason = handoff.strip()
-            elif isinstance(handoff, dict):
-                for k in ("reason", "type", "needed"):
-                    v = handoff.get(k)
-                    if isinstance(v, str) and v.strip():
-                        reason = v.strip()
-                        break
-            if not reason and isinstance(qf, list) and qf:
-                first = qf[0]
-                if isinstance(first, str) and first.strip():
-                    reason = first.strip()
-            if not reason:
-                mi = data.get("main_issue")
-                if isinstance(mi, str) and mi.strip():
-                    reason = mi.strip()
-            if reason:
-                unresolved_reasons[reason] = unresolved_reasons.get(reason, 0) + 1
+            loaded = orjson.loads(METRICS_STATE_PATH.read_bytes())
+            if isinstance(loaded, dict) and isinstance(loaded.get("files"), dict):
+                state = loaded
+        except orjson.JSONDecodeError:
+            pass
+    resolution = Counter({"resolved": 0, "partial": 0, "unresolved": 0, "unknown": 0})
+    resolution.update(state.get("resolution") or {})
+    state["resolution"] = resolution
+    for name in _METRIC_COUNTERS:
+        state[name] = Counter(state.get(name) or {})
+    return state
 
-    top_reasons: list[dict[str, Any]] = []
+
+def compute_metrics(max_files: int = 5000) -> dict[str, Any]:
+    """Return dashboard metrics, recomputing only when the source files change."""
+    global _METRICS_STATE
+    per_call_dir = REPO_ROOT / "insights_per_call"
+    entries: list[tuple[str, int, int]] = []
+    if per_call_dir.exists():
+        with os.scandir(per_call_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json") or not entry.is_file():
+                    continue
+                st = entry.stat()
+                entries.append((entry.name, st.st_mtime_ns, st.st_size))
+    entries.sort()
+    entries = entries[:max_files]
     top_path = REPO_ROOT / "insights_global" / "global_top_intents.json"
+    key = (tuple(entries), _stat_signature(top_path))
+
+    with _METRICS_LOCK:
+        if _METRICS_CACHE["key"] == key:
+            return _METRICS_CACHE["value"]
+        if _METRICS_STATE is None:
+            _METRICS_STATE = _load_metrics_state()
+        state = _METRICS_STATE
+        known: dict[str, list[Any]] = state["files"]
+        current = {name: (mtime_ns, size) for name, mtime_ns, size in entries}
+        changed = False
+        for name in [n for n in known if n not in current]:
+            _apply_contribution(state, known.pop(name)[2], -1)
+            changed = True
+        stale: list[str] = []
+        for name, (mtime_ns, size) in current.items():
+            prev = known.get(name)
+            if prev is not None and prev[0] == mtime_ns and prev[1] == size:
+                continue
+            if prev is not None:
+                _apply_contribution(state, prev[2], -1)
+            stale.append(name)
+        paths = [per_call_dir / name for name in stale]
+        if len(paths) >= METRICS_PARALLEL_MIN:
+            with ThreadPoolExecutor(max_workers=METRICS_WORKERS) as pool:
+                contribs = list(pool.map(_file_contribution, paths))
+        else:
+            contribs = [_file_contribution(fp) for fp in paths]
+        for name, contrib in zip(stale, contribs):
+            _apply_contribution(state, contrib, 1)
+            known[name] = [*current[name], contrib]
+            changed = True
+        if changed:
+            _prune_counters(state)
+            atomic_write_bytes(METRICS_STATE_PATH, orjson.dumps(state))
+        value = _summarize_metrics(state, top_path)
+        _METRICS_CACHE["key"] = key
+        _METRICS_CACHE["value"] = value
+        return value
+
+
+def _summarize_metrics(state: dict[str, Any], top_path: Path) -> dict[str, Any]:
+    top_reasons: list[dict[str, Any]] = []
     if top_path.exists():
         try:
-            payload = json.loads(top_path.read_text(encoding="utf-8"))
+            payload = orjson.loads(top_path.read_bytes())
             if isinstance(payload, list):
                 for row in payload[:20]:
                     if not isinstance(row, dict):
@@ -585,28 +1328,35 @@ def compute_metrics(max_files: int = 5000) -> dict[str, Any]:
         except Exception:
             pass
 
-    def top_n(d: dict[str, int], n: int = 10) -> list[dict[str, Any]]:
-        items = sorted(d.items(), key=lambda kv: kv[1], reverse=True)[:n]
-        return [{"label": k, "value": v} for k, v in items]
+    def top_n(counts: Counter[str], n: int = 10) -> list[dict[str, Any]]:
+        return [{"label": k, "value": v} for k, v in counts.most_common(n)]
 
+    resolution = dict(state["resolution"])
     return {
         "total_calls": sum(resolution.values()),
         "resolution": resolution,
         "top_reasons": top_reasons,
-        "quality_flags_top": top_n(quality_flags, 10),
-        "emotions_top": top_n(emotions, 8),
-        "unresolved_reasons_top": top_n(unresolved_reasons, 10),
-        "note": f"Computed from {min(len(files), max_files)} per-call JSON files.",
+        "quality_flags_top": top_n(state["quality_flags"], 10),
+        "emotions_top": top_n(state["emotions"], 8),
+        "unresolved_reasons_top": top_n(state["unresolved_reasons"], 10),
+        "note": f"Computed from {len(state['files'])} per-call JSON files.",
     }
 
 
+class DemoHTTPServer(ThreadingHTTPServer):
+    # Several tabs reconnecting at once should queue, not get refused.
+    request_queue_size = 64
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=int(os.getenv("DEMO_UI_PORT", "8787")))
     args = parser.parse_args()
 
-    httpd = ThreadingHTTPServer((args.host, args.port), Handler)
+    preload_static()
+    TASK_SERVER.start()
+    httpd = DemoHTTPServer((args.host, args.port), Handler)
     print(f"[demo_ui] Serving on http://{args.host}:{args.port} (repo: {REPO_ROOT})")
     httpd.serve_forever()
 
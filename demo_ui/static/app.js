@@ -6,6 +6,8 @@ const state = {
   runs: [],
   selectedRunId: null,
   logPoll: null,
+  logCursors: {},
+  logStream: null,
   audio: [],
   audioSelected: new Set(),
 };
@@ -26,6 +28,19 @@ async function api(path, opts = {}) {
   return res.json();
 }
 
+async function apiText(path) {
+  const res = await fetch(path);
+  if (!res.ok) {
+    let msg = `${res.status}`;
+    try {
+      const data = await res.json();
+      msg = data?.error || msg;
+    } catch {}
+    throw new Error(msg);
+  }
+  return res.text();
+}
+
 function setBadge(status, text) {
   const badge = $("#sessionBadge");
   const dot = badge.querySelector(".dot");
@@ -113,12 +128,53 @@ function renderRunsList() {
 }
 
 async function loadLog(runId, targetSelector = "#liveLog") {
-  const resp = await api(`/api/log?run_id=${encodeURIComponent(runId)}&limit=400`);
-  const view = $(targetSelector);
-  view.textContent = resp.lines.join("\n") || "(empty)";
+  // Polls for the same run only fetch lines written since the last offset.
+  const cursor = state.logCursors[targetSelector];
+  const since = cursor && cursor.runId === runId ? `&since=${cursor.offset}` : "";
+  const resp = await api(`/api/log?run_id=${encodeURIComponent(runId)}&limit=400${since}`);
+  state.logCursors[targetSelector] = { runId, offset: resp.offset };
+  renderLog($(targetSelector), resp.lines, resp.append);
+}
+
+function renderLog(view, lines, append) {
+  if (append) {
+    if (lines.length) {
+      const prev = view.textContent === "(empty)" ? [] : view.textContent.split("\n");
+      view.textContent = prev.concat(lines).slice(-400).join("\n");
+    }
+  } else {
+    view.textContent = lines.join("\n") || "(empty)";
+  }
   view.scrollTop = view.scrollHeight;
 }
 
+// Live log over server-sent events, continuing from the last polled offset.
+// Returns null when unsupported; on errors the caller falls back to polling.
+function streamLog(runId, targetSelector) {
+  if (!window.EventSource) return null;
+  const cursor = state.logCursors[targetSelector];
+  const since = cursor && cursor.runId === runId ? cursor.offset : 0;
+  const es = new EventSource(`/api/log/stream?run_id=${encodeURIComponent(runId)}&since=${since}`);
+  const done = () => {
+    es.close();
+    if (state.logStream === es) state.logStream = null;
+  };
+  es.onmessage = (ev) => {
+    const data = JSON.parse(ev.data);
+    state.logCursors[targetSelector] = { runId, offset: data.offset };
+    renderLog($(targetSelector), data.lines, true);
+  };
+  es.addEventListener("refresh", async () => {
+    done();
+    delete state.logCursors[targetSelector];
+    await loadLog(runId, targetSelector);
+    state.logStream = streamLog(runId, targetSelector);
+  });
+  es.addEventListener("end", done);
+  es.onerror = done;
+  return es;
+}
+
 async function runTask(task) {
   if (!state.session) {
     await startSession();
@@ -135,6 +191,14 @@ async function runTask(task) {
   $("#btnStop").disabled = false;
 
   if (state.logPoll) clearInterval(state.logPoll);
+  if (state.logStream) state.logStream.close();
+  state.logStream = null;
+  try {
+    await loadLog(run.id, "#liveLog");
+    state.logStream = streamLog(run.id, "#liveLog");
+  } catch {
+    // polling below picks the log up
+  }
   state.logPoll = setInterval(async () => {
     try {
       await refreshRuns();
@@ -142,7 +206,7 @@ async function runTask(task) {
       if (current) {
         const st = formatStatus(current).text;
         $("#lastStatus").textContent = st;
-        await loadLog(run.id, "#liveLog");
+        if (!state.logStream) await loadLog(run.id, "#liveLog");
         if (["success", "failed", "stopped"].includes(current.status)) {
           clearInterval(state.logPoll);
           state.logPoll = null;
@@ -233,29 +297,16 @@ async function uploadAudioFiles() {
   const files = Array.from(input.files || []);
   if (!files.length) return;
 
-  const toB64 = (file) =>
-    new Promise((resolve, reject) => {
-      const reader = new FileReader();
-      reader.onerror = () => reject(new Error("Failed to read file"));
-      reader.onload = () => {
-        const bytes = new Uint8Array(reader.result);
-        let binary = "";
-        const chunk = 0x8000;
-        for (let i = 0; i < bytes.length; i += chunk) {
-          binary += String.fromCharCode.apply(null, bytes.subarray(i, i + chunk));
-        }
-        resolve(btoa(binary));
-      };
-      reader.readAsArrayBuffer(file);
-    });
-
   $("#btnUploadAudio").disabled = true;
   try {
-    const payload = [];
+    // Raw bytes, one request per file: the server streams each body straight to disk.
     for (const f of files) {
-      payload.push({ name: f.name, data_base64: await toB64(f) });
+      await api(`/api/audio/upload?name=${encodeURIComponent(f.name)}`, {
+        method: "POST",
+        headers: { "Content-Type": "application/octet-stream" },
+        body: f,
+      });
     }
-    await api("/api/audio/upload", { method: "POST", body: JSON.stringify({ files: payload }) });
     input.value = "";
     await refreshAudio();
   } finally {
@@ -280,8 +331,8 @@ async function loadSelectedJson() {
   const kind = $("#jsonKind").value;
   const name = $("#jsonFile").value;
   if (!name) return;
-  const resp = await api(`/api/file?kind=${encodeURIComponent(kind)}&name=${encodeURIComponent(name)}`);
-  $("#jsonView").textContent = prettyJson(resp.text);
+  const text = await apiText(`/api/file?kind=${encodeURIComponent(kind)}&name=${encodeURIComponent(name)}`);
+  $("#jsonView").textContent = prettyJson(text);
 }
 
 function svgBarChart({ title, data, maxBars = 8 }) {
@@ -0,0 +1,177 @@
+"""Fork server for pipeline scripts started from the demo UI.
+
+`serve` imports the dependencies shared by the pipeline scripts once and then
+forks a child per request, so a task pays neither interpreter startup nor those
+imports again. Used as `PY` for make targets, the client mode hands its own
+stdout/stderr to the server over a unix socket, relays SIGTERM/SIGINT to the
+forked child and exits with its return code; if no server is listening it
+simply execs the script in a fresh interpreter.
+
+    python demo_ui/task_server.py serve --socket demo_ui/.state/tasks.sock
+    python demo_ui/task_server.py scripts/31_analyze_batch_rollup.py --in ...
+"""
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+
+SOCKET_ENV = "DEMO_UI_TASK_SOCKET"
+
+# Imported once in the server; heavy ML stacks (torch, whisperx) stay out so
+# that CUDA is never initialised in a process that forks. Only third-party
+# packages: the repo's own modules (scripts/utils.py) are imported fresh by each
+# child, so edits to them take effect without restarting the server.
+PRELOAD = ("orjson", "dotenv", "tqdm", "numpy", "pandas", "tabulate", "openai")
+
+
+def _preload() -> None:
+    for name in PRELOAD:
+        try:
+            __import__(name)
+        except Exception:  # noqa: BLE001
+            pass
+
+
+def _run_child(request: dict, fds: list[int]) -> None:
+    """Runs in the forked child: become the script, then exit with its code."""
+    import runpy
+    import traceback
+
+    code = 0
+    try:
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        script = os.path.abspath(request["argv"][0])
+        sys.argv = list(request["argv"])
+        sys.path[0] = os.path.dirname(script)
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as exc:
+        if isinstance(exc.code, int) or exc.code is None:
+            code = exc.code or 0
+        else:
+            print(exc.code, file=sys.stderr)
+            code = 1
+    except BaseException:  # noqa: BLE001
+        traceback.print_exc()
+        code = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:  # noqa: BLE001
+                pass
+        os._exit(code)
+
+
+def _wait_child(conn: socket.socket, pid: int) -> None:
+    _, status = os.waitpid(pid, 0)
+    try:
+        conn.sendall(json.dumps({"returncode": os.waitstatus_to_exitcode(status)}).encode() + b"\n")
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def _handle(server: socket.socket, conn: socket.socket) -> None:
+    data, fds, _, _ = socket.recv_fds(conn, 1 << 16, 2)
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            break
+        data += chunk
+    if len(fds) != 2 or not data.endswith(b"\n"):
+        for fd in fds:
+            os.close(fd)
+        conn.close()
+        return
+    request = json.loads(data)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        # The task must not hold the listening socket (or this request's reply channel).
+        server.close()
+        conn.close()
+        _run_child(request, fds)
+    for fd in fds:
+        os.close(fd)
+    conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+    threading.Thread(target=_wait_child, args=(conn, pid), daemon=True).start()
+
+
+def serve(sock_path: str) -> None:
+    _preload()
+    try:
+        os.unlink(sock_path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(sock_path)
+    server.listen(16)
+    while True:
+        conn, _ = server.accept()
+        try:
+            _handle(server, conn)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[task_server] request failed: {exc}", file=sys.stderr)
+            conn.close()
+
+
+def run_client(argv: list[str]) -> None:
+    sock_path = os.getenv(SOCKET_ENV, "")
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if not sock_path:
+            raise OSError("no task server configured")
+        conn.connect(sock_path)
+        request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+        socket.send_fds(conn, [json.dumps(request).encode() + b"\n"], [1, 2])
+        replies = conn.makefile("rb")
+        pid = json.loads(replies.readline())["pid"]
+    except (OSError, ValueError, KeyError):
+        conn.close()
+        os.execv(sys.executable, [sys.executable, *argv])
+
+    def forward(signum: int, _frame: object) -> None:
+        os.kill(pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    line = replies.readline()
+    returncode = json.loads(line)["returncode"] if line else 1
+    if returncode < 0:
+        # Die from the same signal so make reports the task the way it would have.
+        signal.signal(-returncode, signal.SIG_DFL)
+        os.kill(os.getpid(), -returncode)
+    sys.exit(returncode)
+
+
+def main() -> None:
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        import argparse
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("mode")
+        parser.add_argument("--socket", required=True)
+        serve(parser.parse_args().socket)
+    elif len(sys.argv) >= 2:
+        run_client(sys.argv[1:])
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
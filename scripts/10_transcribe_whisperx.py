@@ -1,5 +1,7 @@
 import argparse
+import multiprocessing as mp
 import os
+import re
 from pathlib import Path
 from typing import Any, Dict, List
 
@@ -9,7 +11,7 @@ from tqdm import tqdm
 import whisperx
 from whisperx.diarize import DiarizationPipeline
 
-from utils import list_audio, write_json, should_skip
+from utils import existing_names, list_audio, write_json, should_skip
 
 
 AGENT_HINTS = (
@@ -27,25 +29,27 @@ CLIENT_HINTS = (
     "могу",
 )
 
+# One alternation per hint list: a single scan of the text instead of one
+# substring search per hint; IGNORECASE replaces lowering every segment.
+AGENT_PATTERN = re.compile("|".join(map(re.escape, AGENT_HINTS)), re.IGNORECASE)
+CLIENT_PATTERN = re.compile("|".join(map(re.escape, CLIENT_HINTS)), re.IGNORECASE)
 
-def as_float(value: Any) -> float | None:
-    if value is None:
-        return None
-    if isinstance(value, (np.floating, np.integer)):
-        return float(value)
-    if isinstance(value, np.ndarray):
-        return float(value.tolist())
-    return value  # type: ignore[return-value]
+
+def as_floats(values: List[Any]) -> List[float | None]:
+    """Cast timestamps (floats, numpy scalars or 0-d arrays) in one numpy pass; None stays None."""
+    arr = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return [None if v != v else v for v in arr.tolist()]
 
 
 def guess_role(text: str, speaker: str, cache: Dict[str, str]) -> str:
-    if speaker in cache:
-        return cache[speaker]
+    # Speakers are resolved once; later segments cost a single dict lookup.
+    cached = cache.get(speaker)
+    if cached is not None:
+        return cached
 
-    lowered = text.lower()
-    if any(key in lowered for key in AGENT_HINTS):
+    if AGENT_PATTERN.search(text):
         cache[speaker] = "agent"
-    elif any(key in lowered for key in CLIENT_HINTS):
+    elif CLIENT_PATTERN.search(text):
         cache[speaker] = "client"
     else:
         if "agent" not in cache.values():
@@ -58,22 +62,26 @@ def guess_role(text: str, speaker: str, cache: Dict[str, str]) -> str:
 
 
 def merge_segments(segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not segments:
+        return []
+    # Same-speaker runs are found in one vectorized pass over integer speaker
+    # codes; texts are then joined once per run.
+    codes = np.unique([segment["speaker"] for segment in segments], return_inverse=True)[1]
+    bounds = [0, *(np.flatnonzero(np.diff(codes)) + 1).tolist(), len(segments)]
     merged: List[Dict[str, Any]] = []
-    for segment in segments:
-        if not merged:
-            merged.append(segment)
-            continue
-        if merged[-1]["speaker"] == segment["speaker"]:
-            merged[-1]["end"] = segment["end"]
-            merged[-1]["text"] += f" {segment['text']}"
-        else:
-            merged.append(segment)
+    for lo, hi in zip(bounds, bounds[1:]):
+        segment = segments[lo]
+        segment["end"] = segments[hi - 1]["end"]
+        segment["text"] = " ".join(seg["text"] for seg in segments[lo:hi])
+        merged.append(segment)
     return merged
 
 
 def collect_segments(aligned_segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     role_map: Dict[str, str] = {}
     cleaned: List[Dict[str, Any]] = []
+    starts = as_floats([segment.get("start") for segment in aligned_segments])
+    ends = as_floats([segment.get("end") for segment in aligned_segments])
     for idx, segment in enumerate(aligned_segments):
         text = (segment.get("text") or "").strip()
         if not text:
@@ -83,8 +91,8 @@ def collect_segments(aligned_segments: List[Dict[str, Any]]) -> List[Dict[str, A
         cleaned.append(
             {
                 "id": idx,
-                "start": as_float(segment.get("start")),
-                "end": as_float(segment.get("end")),
+                "start": starts[idx],
+                "end": ends[idx],
                 "speaker": str(speaker),
                 "role": role,
                 "text": text,
@@ -93,6 +101,98 @@ def collect_segments(aligned_segments: List[Dict[str, Any]]) -> List[Dict[str, A
     return merge_segments(cleaned)
 
 
+# Per-process transcription state; each pool worker loads its models once.
+_WORKER: Dict[str, Any] = {}
+
+
+def load_worker(args: argparse.Namespace) -> Dict[str, Any]:
+    model = whisperx.load_model(
+        args.model,
+        device=args.device,
+        compute_type=args.compute_type,
+        language=args.language,
+        vad_model=None,
+        vad_options=None,
+    )
+    return {
+        "args": args,
+        "model": model,
+        "align_model": None,
+        "metadata": None,
+        "align_language": None,
+        "diar_pipeline": None,
+    }
+
+
+def init_worker(args: argparse.Namespace, device_queue: Any) -> None:
+    device_id = device_queue.get()
+    if device_id is not None:
+        # Pin before the first CUDA call; torch initializes CUDA lazily.
+        os.environ["CUDA_VISIBLE_DEVICES"] = device_id
+    _WORKER.update(load_worker(args))
+
+
+def transcribe_file(state: Dict[str, Any], audio_path: Path) -> None:
+    args = state["args"]
+    out_path = Path(args.out_dir) / f"{audio_path.stem}.whisperx.json"
+    align_device = args.align_device or args.device
+    diar_device = args.diarization_device or args.device
+    hf_token = (args.hf_token or "").strip()
+    try:
+        transcription = state["model"].transcribe(
+            str(audio_path),
+            batch_size=args.batch_size,
+            language=args.language,
+            task="transcribe",
+        )
+
+        segments = transcription["segments"]
+        language = transcription.get("language", args.language)
+
+        if state["align_language"] != language:
+            state["align_model"], state["metadata"] = whisperx.load_align_model(
+                language_code=language,
+                device=align_device,
+            )
+            state["align_language"] = language
+
+        aligned = whisperx.align(
+            segments,
+            state["align_model"],
+            state["metadata"],
+            str(audio_path),
+            align_device,
+            return_char_alignments=False,
+        )
+
+        if hf_token and not args.disable_diarization:
+            if state["diar_pipeline"] is None:
+                state["diar_pipeline"] = DiarizationPipeline(
+                    use_auth_token=hf_token,
+                    device=diar_device,
+                )
+            diar_segments = state["diar_pipeline"](str(audio_path))
+            aligned = whisperx.assign_word_speakers(diar_segments, aligned)
+
+        cleaned_segments = collect_segments(aligned["segments"])
+        result = {
+            "conversation_id": audio_path.stem,
+            "task": "transcribe",
+            "language": language,
+            "segments": cleaned_segments,
+            "text": " ".join(seg["text"] for seg in cleaned_segments),
+        }
+        write_json(out_path, result, numpy=True)
+    except Exception as exc:  # noqa: BLE001
+        import traceback
+        traceback.print_exc()
+        print(f"[ERROR] {audio_path.name}: {exc}")
+
+
+def process_file(audio_path: Path) -> None:
+    transcribe_file(_WORKER, audio_path)
+
+
 def main() -> None:
     load_dotenv()
     parser = argparse.ArgumentParser()
@@ -108,85 +208,36 @@ def main() -> None:
     parser.add_argument("--hf-token", default=os.getenv("HUGGINGFACE_TOKEN", ""))
     parser.add_argument("--disable-diarization", action="store_true")
     parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--devices", default="", help="Comma-separated CUDA device ids to shard files across, e.g. 0,1")
+    parser.add_argument("--num-workers", type=int, default=0, help="Worker processes (default: one per device)")
     args = parser.parse_args()
 
     in_dir = Path(args.in_dir)
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    align_device = args.align_device or args.device
-    diar_device = args.diarization_device or args.device
-    hf_token = (args.hf_token or "").strip()
-
-    model = whisperx.load_model(
-        args.model,
-        device=args.device,
-        compute_type=args.compute_type,
-        language=args.language,
-        vad_model=None,
-        vad_options=None,
-    )
-
-    align_model = None
-    metadata = None
-    current_align_language = None
-    diar_pipeline = None
-
-    audio_files = sorted(list_audio(in_dir))
-    for audio_path in tqdm(audio_files, desc="WhisperX transcribe"):
-        out_path = out_dir / f"{audio_path.stem}.whisperx.json"
-        if should_skip(out_path, args.overwrite):
-            continue
-
-        try:
-            transcription = model.transcribe(
-                str(audio_path),
-                batch_size=args.batch_size,
-                language=args.language,
-                task="transcribe",
-            )
-
-            segments = transcription["segments"]
-            language = transcription.get("language", args.language)
-
-            if current_align_language != language:
-                align_model, metadata = whisperx.load_align_model(
-                    language_code=language,
-                    device=align_device,
-                )
-                current_align_language = language
-
-            aligned = whisperx.align(
-                segments,
-                align_model,
-                metadata,
-                str(audio_path),
-                align_device,
-                return_char_alignments=False,
-            )
-
-            if hf_token and not args.disable_diarization:
-                if diar_pipeline is None:
-                    diar_pipeline = DiarizationPipeline(
-                        use_auth_token=hf_token,
-                        device=diar_device,
-                    )
-                diar_segments = diar_pipeline(str(audio_path))
-                aligned = whisperx.assign_word_speakers(diar_segments, aligned)
-
-            cleaned_segments = collect_segments(aligned["segments"])
-            result = {
-                "conversation_id": audio_path.stem,
-                "task": "transcribe",
-                "language": language,
-                "segments": cleaned_segments,
-                "text": " ".join(seg["text"] for seg in cleaned_segments),
-            }
-            write_json(out_path, result)
-        except Exception as exc:  # noqa: BLE001
-            import traceback
-            traceback.print_exc()
-            print(f"[ERROR] {audio_path.name}: {exc}")
+    done = existing_names(out_dir)
+    audio_files = [
+        audio_path
+        for audio_path in sorted(list_audio(in_dir))
+        if not should_skip(out_dir / f"{audio_path.stem}.whisperx.json", args.overwrite, existing=done)
+    ]
+    devices = [d.strip() for d in args.devices.split(",") if d.strip()]
+    num_workers = min(args.num_workers or len(devices) or 1, max(len(audio_files), 1))
+
+    if num_workers <= 1:
+        state = load_worker(args)
+        for audio_path in tqdm(audio_files, desc="WhisperX transcribe"):
+            transcribe_file(state, audio_path)
+        return
+
+    ctx = mp.get_context("spawn")
+    device_queue = ctx.Queue()
+    for i in range(num_workers):
+        device_queue.put(devices[i % len(devices)] if devices else None)
+    with ctx.Pool(num_workers, initializer=init_worker, initargs=(args, device_queue)) as pool:
+        for _ in tqdm(pool.imap_unordered(process_file, audio_files), total=len(audio_files), desc="WhisperX transcribe"):
+            pass
 
 
 if __name__ == "__main__":
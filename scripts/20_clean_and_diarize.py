@@ -1,4 +1,5 @@
 import argparse
+import re
 from pathlib import Path
 from dotenv import load_dotenv
 from tqdm import tqdm
@@ -26,7 +27,7 @@ except Exception:  # noqa: BLE001
 
 import whisperx
 
-from utils import read_json, write_json, normalize_text, should_skip
+from utils import existing_names, read_json, write_json, normalize_text, should_skip
 
 # Maps speakers (SPEAKER_00/01) to roles (agent/client) using heuristics.
 # If you want true diarization, enable pyannote via WhisperX DiarizationPipeline.
@@ -39,10 +40,10 @@ AGENT_HEURISTICS = [
     "назовите, пожалуйста, номер договора",
     "секунду, я проверю",
 ]
+AGENT_PATTERN = re.compile("|".join(map(re.escape, AGENT_HEURISTICS)), re.IGNORECASE)
 
 def guess_role(text_segment: str) -> str | None:
-    lower_text = text_segment.lower()
-    if any(key_phrase in lower_text for key_phrase in AGENT_HEURISTICS):
+    if AGENT_PATTERN.search(text_segment):
         return "agent"
     return None
 
@@ -66,6 +67,7 @@ def main() -> None:
 
         diarizer = whisperx.DiarizationPipeline(use_auth_token=getenv("HUGGINGFACE_TOKEN"), device=args.device)
 
+    done = existing_names(out_dir)
     for file_path in tqdm(sorted(in_dir.glob("*.json")), desc="Cleaning/Diarizing"):
         raw = read_json(file_path)
         audio_fp = None
@@ -85,7 +87,7 @@ def main() -> None:
 
         conversation_id = file_path.stem.replace(".whisperx", "").replace(".whisper", "")
         out_path = out_dir / f"{conversation_id}.json"
-        if should_skip(out_path, args.overwrite):
+        if should_skip(out_path, args.overwrite, existing=done):
             continue
 
         conversation = {
@@ -109,7 +111,7 @@ def main() -> None:
                 }
             )
 
-        write_json(out_path, conversation)
+        write_json(out_path, conversation, numpy=True)
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,13 @@
 import argparse
-import json
+import asyncio
 import os
 from pathlib import Path
+import orjson
 from dotenv import load_dotenv
 from tqdm import tqdm
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-from utils import chunked, list_files, read_json, write_json, should_skip
+from utils import existing_names, iter_files, read_json, write_json, should_skip
 
 
 def select_temperature(model: str, fallback: float = 0.0) -> float:
@@ -15,47 +16,61 @@ def select_temperature(model: str, fallback: float = 0.0) -> float:
         return 1.0
     return fallback
 
-def main() -> None:
-    load_dotenv()
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--in", dest="in_dir", required=True)
-    parser.add_argument("--out", dest="out_dir", required=True)
-    parser.add_argument("--prompt", default="prompts/per_call_analysis_ru.md")
-    parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-5.1"))
-    parser.add_argument("--batch-size", type=int, default=10)
-    parser.add_argument("--overwrite", action="store_true")
-    args = parser.parse_args()
-
-    client = OpenAI()
+async def analyze_all(args: argparse.Namespace) -> None:
+    # The client already retries rate limits and 5xx with exponential backoff.
+    client = AsyncOpenAI(max_retries=args.max_retries)
     in_dir = Path(args.in_dir)
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     sys_prompt = Path(args.prompt).read_text(encoding="utf-8")
 
-    files = list_files(in_dir, ".json")
+    # Each call is analysed independently; the order they run in does not matter.
+    files = list(iter_files(in_dir, ".json"))
+    done = existing_names(out_dir)
     progress = tqdm(total=len(files), desc="Per-call analysis")
-    for batch in chunked(files, args.batch_size):
-        for file_path in batch:
-            convo = read_json(file_path)
-            output_path = out_dir / f"{convo['conversation_id']}.json"
-            if should_skip(output_path, args.overwrite):
-                progress.update(1)
-                continue
-            message = f"{sys_prompt}\n\nДанные разговора:\n```json\n{json.dumps(convo, ensure_ascii=False)}\n```"
-            try:
-                response = client.chat.completions.create(
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    temperature = select_temperature(args.model)
+
+    async def process(file_path: Path) -> None:
+        try:
+            # Load inside the semaphore: only --concurrency transcripts and prompts are
+            # held at once, and requests start going out before the whole input is read.
+            async with semaphore:
+                convo = await asyncio.to_thread(read_json, file_path)
+                output_path = out_dir / f"{convo['conversation_id']}.json"
+                if should_skip(output_path, args.overwrite, existing=done):
+                    return
+                message = f"{sys_prompt}\n\nДанные разговора:\n```json\n{orjson.dumps(convo).decode()}\n```"
+                response = await client.chat.completions.create(
                     model=args.model,
-                    temperature=select_temperature(args.model),
+                    temperature=temperature,
+                    response_format={"type": "json_object"},
                     messages=[{"role": "user", "content": message}],
                 )
-                content = response.choices[0].message.content
-                data = json.loads(content)
-                write_json(output_path, data)
-            except Exception as exc:  # noqa: BLE001
-                print(f"[ERROR] {file_path.name}: {exc}")
-            finally:
-                progress.update(1)
+            content = response.choices[0].message.content
+            data = orjson.loads(content)
+            await asyncio.to_thread(write_json, output_path, data)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[ERROR] {file_path.name}: {exc}")
+        finally:
+            progress.update(1)
+
+    await asyncio.gather(*(process(fp) for fp in files))
     progress.close()
 
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--in", dest="in_dir", required=True)
+    parser.add_argument("--out", dest="out_dir", required=True)
+    parser.add_argument("--prompt", default="prompts/per_call_analysis_ru.md")
+    parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-5.1"))
+    parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight API requests")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(analyze_all(args))
+
 if __name__ == "__main__":
     main()
@@ -1,13 +1,14 @@
 import argparse
+import asyncio
 import hashlib
-import json
 import os
 from pathlib import Path
+import orjson
 from dotenv import load_dotenv
 from tqdm import tqdm
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-from utils import list_files, read_json, write_json
+from utils import ResponseCache, list_files, read_json, write_json
 
 
 def select_temperature(model: str, fallback: float = 0.0) -> float:
@@ -21,39 +22,72 @@ def chunks(items, size):
     for index in range(0, len(items), size):
         yield items[index : index + size]
 
-def main() -> None:
-    load_dotenv()
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--in", dest="in_dir", required=True)
-    parser.add_argument("--out", dest="out_dir", required=True)
-    parser.add_argument("--prompt", default="prompts/batch_rollup_ru.md")
-    parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-5.1"))
-    parser.add_argument("--batch-size", type=int, default=15)
-    args = parser.parse_args()
-
-    client = OpenAI()
+async def rollup_all(args: argparse.Namespace) -> None:
+    # The client already retries rate limits (honouring Retry-After) and 5xx.
+    client = AsyncOpenAI(max_retries=args.max_retries)
     in_dir = Path(args.in_dir)
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     sys_prompt = Path(args.prompt).read_text(encoding="utf-8")
 
     files = list_files(in_dir, ".json")
-    for group in tqdm(chunks(files, args.batch_size), desc="Batch rollups"):
-        payload = [read_json(path) for path in group]
-        ids = ",".join([item.get("conversation_id", "") for item in payload])
-        batch_id = hashlib.md5(ids.encode()).hexdigest()[:12]
-        message = f"{sys_prompt}\n\nВходные карточки:\n```json\n{json.dumps(payload, ensure_ascii=False)}\n```"
+    groups = list(chunks(files, args.batch_size))
+    progress = tqdm(total=len(groups), desc="Batch rollups")
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    temperature = select_temperature(args.model)
+    cache = ResponseCache(None if args.no_cache else args.cache_dir)
+
+    async def process(group: list[Path]) -> None:
+        batch_id = group[0].name  # until the real id is known
         try:
-            response = client.chat.completions.create(
-                model=args.model,
-                temperature=select_temperature(args.model),
-                messages=[{"role": "user", "content": message}],
-            )
-            data = json.loads(response.choices[0].message.content)
+            # Load inside the semaphore: only --concurrency batches are held as prompts
+            # at once, and requests start going out before the whole corpus is read.
+            async with semaphore:
+                payload = await asyncio.to_thread(lambda: [read_json(path) for path in group])
+                ids = ",".join([item.get("conversation_id", "") for item in payload])
+                # Same id scheme as earlier runs, so re-runs overwrite existing batch
+                # files instead of adding differently named copies for step 32 to count twice.
+                batch_id = hashlib.md5(ids.encode(), usedforsecurity=False).hexdigest()[:12]
+                message = f"{sys_prompt}\n\nВходные карточки:\n```json\n{orjson.dumps(payload).decode()}\n```"
+                key = cache.key(args.model, str(temperature), message)
+                content = cache.get(key)
+                fetched = content is None
+                if fetched:
+                    response = await client.chat.completions.create(
+                        model=args.model,
+                        temperature=temperature,
+                        response_format={"type": "json_object"},
+                        messages=[{"role": "user", "content": message}],
+                    )
+                    content = response.choices[0].message.content
+            data = orjson.loads(content)
+            if fetched:
+                cache.put(key, content)
             data["batch_id"] = batch_id
-            write_json(out_dir / f"batch_{batch_id}.json", data)
+            await asyncio.to_thread(write_json, out_dir / f"batch_{batch_id}.json", data)
         except Exception as exc:  # noqa: BLE001
             print(f"[ERROR] batch {batch_id}: {exc}")
+        finally:
+            progress.update(1)
+
+    await asyncio.gather(*(process(group) for group in groups))
+    progress.close()
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--in", dest="in_dir", required=True)
+    parser.add_argument("--out", dest="out_dir", required=True)
+    parser.add_argument("--prompt", default="prompts/batch_rollup_ru.md")
+    parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-5.1"))
+    parser.add_argument("--batch-size", type=int, default=15)
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("OPENAI_CONCURRENCY", "16")))
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--cache-dir", default=".cache/llm", help="Replies keyed by model+prompt+payload")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(rollup_all(args))
 
 if __name__ == "__main__":
     main()
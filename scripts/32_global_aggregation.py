@@ -1,7 +1,8 @@
 import argparse
+from collections import Counter
 from pathlib import Path
 
-from utils import list_files, read_json, write_json
+from utils import list_files, read_json_many, write_json_many
 
 def main() -> None:
     parser = argparse.ArgumentParser()
@@ -11,25 +12,23 @@ def main() -> None:
 
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
-    batches = [read_json(path) for path in list_files(args.in_dir, ".json")]
-
-    top_intent_counts = {}
+    top_intent_counts: Counter[str] = Counter()
     faq_clusters = []
-    for batch in batches:
+    # Batches are folded in as they are read, so only the readahead window is in memory.
+    for batch in read_json_many(list_files(args.in_dir, ".json")):
         for intent in batch.get("top_intents", []):
-            name = intent["intent"]
-            top_intent_counts[name] = top_intent_counts.get(name, 0) + intent["count"]
+            top_intent_counts[intent["intent"]] += intent["count"]
         faq_clusters.extend(batch.get("faq_clusters", []))
 
-    write_json(
-        out_dir / "global_top_intents.json",
-        sorted(
-            [{"intent": name, "count": count} for name, count in top_intent_counts.items()],
-            key=lambda item: item["count"],
-            reverse=True,
-        ),
+    write_json_many(
+        [
+            (
+                out_dir / "global_top_intents.json",
+                [{"intent": name, "count": count} for name, count in top_intent_counts.most_common()],
+            ),
+            (out_dir / "global_faq_clusters_raw.json", faq_clusters),
+        ]
     )
-    write_json(out_dir / "global_faq_clusters_raw.json", faq_clusters)
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,11 @@
 import argparse
-import json
+import os
 from pathlib import Path
+from typing import Iterator
 
-from utils import list_files, read_json
+import orjson
+
+from utils import list_files, read_json_many
 
 
 def normalize_hashtags(intent: str | None, subtopics: list[str] | None) -> list[str]:
@@ -20,42 +23,53 @@ def normalize_hashtags(intent: str | None, subtopics: list[str] | None) -> list[
     return tags
 
 
+def iter_records(file_path: Path, payload: dict) -> Iterator[dict]:
+    conversation_id = payload.get("conversation_id", file_path.stem)
+    verbatim_pairs = payload.get("verbatim_QA_pairs") or []
+    hashtags = normalize_hashtags(payload.get("client_intent"), payload.get("subtopics"))
+    quality_flags = payload.get("quality_flags") or []
+
+    for index, pair in enumerate(verbatim_pairs, start=1):
+        record = {
+            "call_id": conversation_id,
+            "pair_index": index,
+            "question": pair.get("q", "").strip(),
+            "answer": pair.get("a", "").strip(),
+            "question_speaker": pair.get("question_speaker", "client"),
+            "answer_speaker": pair.get("answer_speaker", "agent"),
+            "intent": payload.get("client_intent"),
+            "hashtags": hashtags,
+            "quality_flags": quality_flags,
+            "source_file": str(file_path),
+            "needs_review": False,
+            "review_notes": "",
+        }
+        # Skip empty rows that can appear if the LLM failed to extract a QA pair.
+        if not record["question"] and not record["answer"]:
+            continue
+        yield record
+
+
 def export_pairs(in_dir: Path, out_path: Path) -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    records: list[str] = []
-
-    for file_path in list_files(in_dir, ".json"):
-        payload = read_json(file_path)
-        conversation_id = payload.get("conversation_id", file_path.stem)
-        verbatim_pairs = payload.get("verbatim_QA_pairs") or []
-        hashtags = normalize_hashtags(payload.get("client_intent"), payload.get("subtopics"))
-        quality_flags = payload.get("quality_flags") or []
-
-        for index, pair in enumerate(verbatim_pairs, start=1):
-            record = {
-                "call_id": conversation_id,
-                "pair_index": index,
-                "question": pair.get("q", "").strip(),
-                "answer": pair.get("a", "").strip(),
-                "question_speaker": pair.get("question_speaker", "client"),
-                "answer_speaker": pair.get("answer_speaker", "agent"),
-                "intent": payload.get("client_intent"),
-                "hashtags": hashtags,
-                "quality_flags": quality_flags,
-                "source_file": str(file_path),
-                "needs_review": False,
-                "review_notes": "",
-            }
-            # Skip empty rows that can appear if the LLM failed to extract a QA pair.
-            if not record["question"] and not record["answer"]:
-                continue
-            records.append(record)
-
-    # Write newline-delimited JSON to simplify downstream processing.
-    with open(out_path, "w", encoding="utf-8") as handle:
-        for record in records:
-            handle.write(json.dumps(record, ensure_ascii=False))
-            handle.write("\n")
+
+    # Write newline-delimited JSON to simplify downstream processing; records are
+    # streamed out as they are produced, so memory stays flat. They go to a temp
+    # file renamed over the target at the end, so a reader (the review app reruns
+    # while an export is in flight) only ever sees a complete file.
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb", buffering=1 << 20) as handle:
+            files = list_files(in_dir, ".json")
+            option = orjson.OPT_APPEND_NEWLINE
+            for file_path, payload in zip(files, read_json_many(files)):
+                for record in iter_records(file_path, payload):
+                    # orjson appends the newline itself, saving a concatenated copy per row.
+                    handle.write(orjson.dumps(record, option=option))
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 
 def main() -> None:
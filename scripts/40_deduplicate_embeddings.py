@@ -1,19 +1,53 @@
 import argparse
+import os
 from pathlib import Path
 
 import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import pdist
 from sentence_transformers import SentenceTransformer
 from sklearn.cluster import AgglomerativeClustering
+from sklearn.neighbors import kneighbors_graph
+import torch
 
 from utils import read_json, write_json
 
 # Clusters similar questions to avoid duplicates; multilingual model works well for RU.
 
+# Rows of the Gram matrix computed per GPU matmul when building distances on-device.
+GRAM_BLOCK = 2048
+
+
+def cosine_condensed(embeddings: np.ndarray, device: torch.device) -> np.ndarray:
+    """pdist(embeddings, "cosine") for unit vectors; on CUDA the matmul runs in fp16 on the GPU."""
+    if device.type != "cuda":
+        return pdist(embeddings, metric="cosine")
+    n = len(embeddings)
+    emb = torch.from_numpy(embeddings).to(device).half()
+    condensed = np.empty(n * (n - 1) // 2)
+    pos = 0
+    for start in range(0, n - 1, GRAM_BLOCK):
+        block = (1.0 - emb[start : start + GRAM_BLOCK] @ emb.T).float().cpu().numpy()
+        for i, row in enumerate(block, start):
+            tail = row[i + 1 :]
+            condensed[pos : pos + len(tail)] = tail
+            pos += len(tail)
+    # fp16 rounding can push near-duplicates marginally below zero.
+    return np.maximum(condensed, 0.0, out=condensed)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--in", dest="in_dir", required=True)
     parser.add_argument("--out", dest="out_dir", required=True)
     parser.add_argument("--threshold", type=float, default=0.28, help="Agglomerative clustering distance threshold")
+    parser.add_argument("--neighbors", type=int, default=30, help="Nearest neighbours per question in the connectivity graph")
+    parser.add_argument(
+        "--dense-max",
+        type=int,
+        default=8000,
+        help="Up to this many questions cluster exactly on the condensed distance vector; above it, on the neighbour graph",
+    )
     args = parser.parse_args()
 
     in_dir = Path(args.in_dir)
@@ -21,30 +55,67 @@ def main() -> None:
     out_dir.mkdir(parents=True, exist_ok=True)
 
     faq_raw = read_json(in_dir / "global_faq_clusters_raw.json")
-    questions = [item["canonical_q"] for item in faq_raw if item.get("canonical_q")]
+    faq_items = [item for item in faq_raw if item.get("canonical_q")]
+    questions = [item["canonical_q"] for item in faq_items]
 
     if not questions:
         write_json(out_dir / "global_faq_clusters_dedup.json", [])
         return
 
-    model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-    embeddings = model.encode(questions, show_progress_bar=True, normalize_embeddings=True)
-
-    distance_matrix = 1 - np.dot(embeddings, embeddings.T)
-    clustering = AgglomerativeClustering(
-        n_clusters=None,
-        metric="precomputed",
-        linkage="average",
-        distance_threshold=args.threshold,
-    ).fit(distance_matrix)
+    model = SentenceTransformer(os.getenv("EMB_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"))
+    if model.device.type == "cuda":
+        model.half()
+    elif os.getenv("EMB_INT8", "0") == "1":
+        # Opt-in: int8 weights for the Linear layers (fbgemm/VNNI kernels on x86) are
+        # faster on CPU but shift the embeddings slightly, so borderline questions can
+        # land in different clusters than with the full-precision model.
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    # encode() already length-sorts inputs into batches, so padding stays minimal.
+    embeddings = model.encode(
+        questions,
+        batch_size=int(os.getenv("EMB_BATCH", "128")),
+        show_progress_bar=True,
+        normalize_embeddings=True,
+    )
+    # C-contiguous float32 keeps the neighbour search and linkage on SGEMM.
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
 
-    groups: dict[int, list[dict]] = {}
-    for index, label in enumerate(clustering.labels_):
-        groups.setdefault(int(label), []).append(faq_raw[index])
+    if len(questions) < 2:
+        labels = [0] * len(questions)
+    elif len(questions) <= args.dense_max:
+        # Condensed n*(n-1)/2 vector (half of a square matrix) fed to scipy's C
+        # nearest-neighbour-chain average linkage.
+        tree = linkage(cosine_condensed(embeddings, model.device), method="average")
+        labels = fcluster(tree, t=args.threshold, criterion="distance")
+    else:
+        # Merges are restricted to a sparse top-k neighbour graph instead of a
+        # dense n x n distance matrix: O(n*k) memory, and near-duplicates are
+        # always among each other's nearest neighbours anyway.
+        connectivity = kneighbors_graph(
+            embeddings,
+            n_neighbors=min(args.neighbors, len(questions) - 1),
+            metric="cosine",
+            mode="distance",
+            include_self=False,
+        )
+        labels = AgglomerativeClustering(
+            n_clusters=None,
+            metric="cosine",
+            linkage="average",
+            distance_threshold=args.threshold,
+            connectivity=connectivity,
+        ).fit(embeddings).labels_
 
+    # One stable sort groups the rows by label; cluster boundaries are where the label changes.
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind="stable")
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    # The shortest question represents its cluster (first one on ties, as min() did).
+    lengths = np.fromiter((len(question) for question in questions), dtype=np.int64, count=len(questions))
     deduped = []
-    for label, items in groups.items():
-        representative = min(items, key=lambda item: len(item.get("canonical_q", "~" * 999)))
+    for members in np.split(order, bounds):
+        items = [faq_items[index] for index in members]
+        representative = faq_items[members[np.argmin(lengths[members])]]
         merged_ids: list[str] = []
         sources: list[str] = []
         for item in items:
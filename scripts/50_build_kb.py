@@ -1,32 +1,55 @@
 import argparse
-import json
+import asyncio
 import os
+import re
 from pathlib import Path
 
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-from utils import read_json, write_json
+from utils import ResponseCache, read_json, write_json
 
+# An optional "json" tag is matched as a whole word; the closing fence may be missing.
+FENCE_RE = re.compile(r"```(?:json\b)?\s*(.*?)\s*(?:```|\Z)", re.DOTALL | re.IGNORECASE)
+PROMPT_TAIL = b"\n```"
 
-def synthesize_cluster(
-    client: OpenAI,
+
+class SynthesisError(ValueError):
+    """Model output never parsed; keeps the last raw response for the error log."""
+
+    def __init__(self, message: str, content: str) -> None:
+        super().__init__(message)
+        self.content = content
+
+
+async def synthesize_cluster(
+    client: AsyncOpenAI,
     model: str,
-    template: str,
+    prompt_head: bytes,
     cluster: dict,
     temperature: float,
     max_attempts: int,
+    cache: ResponseCache,
 ):
     """Try to synthesize a KB entry; fail-fast if parsing keeps failing."""
     content = ""
+    # Built once; retries only append the reminder suffix.
+    base = (prompt_head + orjson.dumps(cluster) + PROMPT_TAIL).decode()
+    # Keyed on the first-attempt prompt: a cluster maps to one cached entry.
+    key = cache.key(model, str(temperature), base)
+    cached = cache.get(key)
+    if cached is not None:
+        try:
+            return orjson.loads(parse_json_content(cached)), cached
+        except Exception:
+            pass
     for attempt in range(1, max_attempts + 1):
         suffix = ""
         if attempt > 1:
             suffix = "\n\nВажно: верни только валидный JSON без Markdown, без кавычек вне JSON и без лишних запятых."
-        message = (
-            f"{template}\n\nКластер:\n```json\n{json.dumps(cluster, ensure_ascii=False)}\n```{suffix}"
-        )
-        response = client.chat.completions.create(
+        message = base + suffix
+        response = await client.chat.completions.create(
             model=model,
             temperature=temperature,
             response_format={"type": "json_object"},
@@ -35,22 +58,19 @@ def synthesize_cluster(
         content = response.choices[0].message.content or ""
         parsed = parse_json_content(content)
         try:
-            return json.loads(parsed), content
+            entry = orjson.loads(parsed)
         except Exception:
             continue
-    raise ValueError("Failed to parse model output after retries")
+        cache.put(key, content)
+        return entry, content
+    raise SynthesisError("Failed to parse model output after retries", content)
 
 
 def parse_json_content(text: str) -> str:
     """Strip markdown code fences if present and return raw JSON string."""
     cleaned = text.strip()
-    if cleaned.startswith("```"):
-        parts = cleaned.split("```")
-        # parts: ["", "json\n{...}", ""]
-        if len(parts) >= 2:
-            cleaned = parts[1]
-        cleaned = cleaned.lstrip("json").lstrip("JSON").lstrip().strip()
-    return cleaned
+    match = FENCE_RE.match(cleaned)
+    return match.group(1) if match else cleaned
 
 
 def log_bad_response(log_dir: Path, cluster_label: str, content: str) -> None:
@@ -73,49 +93,52 @@ def select_temperature(model: str, fallback: float = 0.0) -> float:
     return fallback
 
 
-def main() -> None:
-    load_dotenv()
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--in", dest="in_dir", required=True)
-    parser.add_argument("--out", dest="out_dir", required=True)
-    parser.add_argument("--prompt", default="prompts/kb_entry_synthesis_ru.md")
-    parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-5.1"))
-    args = parser.parse_args()
-
-    client = OpenAI()
+async def build_kb(args: argparse.Namespace) -> None:
+    # Separate from KB_MAX_RETRIES (unparseable output): these are the client's
+    # own retries of 429/5xx responses, with backoff that honours Retry-After.
+    client = AsyncOpenAI(max_retries=args.max_retries)
     in_dir = Path(args.in_dir)
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     template = Path(args.prompt).read_text(encoding="utf-8")
+    # Encoded once for all clusters; each prompt is head + cluster JSON + tail.
+    prompt_head = f"{template}\n\nКластер:\n```json\n".encode()
     max_attempts = int(os.getenv("KB_MAX_RETRIES", "12"))
     temperature = select_temperature(args.model)
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    cache = ResponseCache(None if args.no_cache else args.cache_dir)
 
-    clusters = read_json(in_dir / "global_faq_clusters_dedup.json")
-    knowledge_base = []
-    for cluster in clusters:
+    async def process(cluster: dict) -> dict:
         cluster_label = (
             cluster.get("canonical_q")
             or cluster.get("cluster_label")
             or "unknown_cluster"
         )
         try:
-            kb_entry, content = synthesize_cluster(
-                client=client,
-                model=args.model,
-                template=template,
-                cluster=cluster,
-                temperature=temperature,
-                max_attempts=max_attempts,
-            )
-            knowledge_base.append(kb_entry)
+            async with semaphore:
+                kb_entry, _ = await synthesize_cluster(
+                    client=client,
+                    model=args.model,
+                    prompt_head=prompt_head,
+                    cluster=cluster,
+                    temperature=temperature,
+                    max_attempts=max_attempts,
+                    cache=cache,
+                )
+            return kb_entry
         except Exception as exc:  # noqa: BLE001
-            if "content" in locals() and content and content.strip():
+            content = getattr(exc, "content", "")
+            if content and content.strip():
                 log_bad_response(out_dir, cluster_label, content)
             raise RuntimeError(
                 f"KB synthesis failed for cluster '{cluster_label}' after {max_attempts} attempts: {exc}"
             ) from exc
 
-    write_json(out_dir / "kb_faq_ru.json", knowledge_base)
+    clusters = read_json(in_dir / "global_faq_clusters_dedup.json")
+    # gather keeps the cluster order; the first failure aborts the build.
+    knowledge_base = list(await asyncio.gather(*(process(cluster) for cluster in clusters)))
+
+    write_json(out_dir / "kb_faq_ru.json", knowledge_base, indent=True)
 
     try:
         import yaml
@@ -125,5 +148,20 @@ def main() -> None:
     except Exception:  # noqa: BLE001
         pass
 
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--in", dest="in_dir", required=True)
+    parser.add_argument("--out", dest="out_dir", required=True)
+    parser.add_argument("--prompt", default="prompts/kb_entry_synthesis_ru.md")
+    parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-5.1"))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("OPENAI_CONCURRENCY", "16")))
+    parser.add_argument("--max-retries", type=int, default=8)
+    parser.add_argument("--cache-dir", default=".cache/llm", help="Replies keyed by model+prompt+cluster")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(build_kb(args))
+
 if __name__ == "__main__":
     main()
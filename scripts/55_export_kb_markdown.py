@@ -1,17 +1,27 @@
 import argparse
-import json
 from pathlib import Path
 
+from utils import read_json
 
-def to_md_list(items, label):
-    """Render a Markdown list section."""
+
+SECTIONS = (
+    ("eligibility_rules", "Условия"),
+    ("required_fields", "Необходимые данные"),
+    ("compliance_notes", "Комплаенс / ограничения"),
+    ("handoff_when", "Эскалация / передать специалисту"),
+    ("empathy_patterns", "Эмпатия"),
+    ("followups", "Доп. вопросы"),
+)
+
+
+def md_list_lines(items, label):
+    """Yield the lines of a Markdown list section."""
     if not items:
-        return ""
-    lines = [f"### {label}", ""]
-    for item in items:
-        lines.append(f"- {item}")
-    lines.append("")
-    return "\n".join(lines)
+        return
+    yield f"### {label}"
+    yield ""
+    yield from (f"- {item}" for item in items)
+    yield ""
 
 
 def main() -> None:
@@ -20,7 +30,7 @@ def main() -> None:
     parser.add_argument("--out", dest="out_path", default="knowledge_base/kb_faq_ru.md")
     args = parser.parse_args()
 
-    data = json.loads(Path(args.in_path).read_text(encoding="utf-8"))
+    data = read_json(args.in_path)
     lines = ["# Knowledge Base", ""]
 
     for entry in data:
@@ -37,12 +47,8 @@ def main() -> None:
             lines.append(answer)
         lines.append("")
 
-        lines.append(to_md_list(entry.get("eligibility_rules"), "Условия"))
-        lines.append(to_md_list(entry.get("required_fields"), "Необходимые данные"))
-        lines.append(to_md_list(entry.get("compliance_notes"), "Комплаенс / ограничения"))
-        lines.append(to_md_list(entry.get("handoff_when"), "Эскалация / передать специалисту"))
-        lines.append(to_md_list(entry.get("empathy_patterns"), "Эмпатия"))
-        lines.append(to_md_list(entry.get("followups"), "Доп. вопросы"))
+        for key, label in SECTIONS:
+            lines.extend(md_list_lines(entry.get(key), label))
 
     Path(args.out_path).write_text("\n".join(lines), encoding="utf-8")
 
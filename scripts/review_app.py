@@ -1,16 +1,20 @@
 import json
 import os
+import re
 import subprocess
-from collections import deque
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List
 
+import orjson
 import streamlit as st
 from dotenv import load_dotenv
-from json import JSONDecodeError
 from openai import OpenAI
 
+from utils import append_jsonl, read_json, write_json
+
 load_dotenv()
 
 KB_PATH = Path("knowledge_base/kb_faq_ru.json")
@@ -21,27 +25,54 @@ INSIGHTS_DIR = Path("insights_per_call")
 OPENAI_MODEL = os.getenv("REVIEW_OPENAI_MODEL", "gpt-5.1")
 OPENAI_READY = bool(os.getenv("OPENAI_API_KEY"))
 MAX_REWRITES = 20
-DETECTION_BATCH_SIZE = 8
+# Operator answers packed into one detection request; a chunk is closed early
+# once its payload nears DETECTION_PROMPT_TOKENS (rough estimate).
+DETECTION_BATCH_SIZE = 32
+DETECTION_PROMPT_TOKENS = 6000
+# Parallel OpenAI requests while checking and rewriting related answers.
+OPENAI_WORKERS = int(os.getenv("REVIEW_OPENAI_WORKERS", "10"))
+JSON_START_RE = re.compile(r"[\[{]")
+WHITESPACE_RE = re.compile(r"\s+")
+JSON_DECODER = json.JSONDecoder()
+
 ELEVEN_CONVAI_AGENT_ID = os.getenv("ELEVEN_CONVAI_AGENT_ID", "agent_6901kbht9aadfe69wts0nvpfdbst")
 ELEVEN_WIDGET_ENABLED = os.getenv("ELEVEN_CONVAI_WIDGET", "1") not in {"0", "false", "False"}
 
-_openai_client: OpenAI | None = None
+DETECT_INSTRUCTION = (
+    "У тебя есть канонический ответ и комментарий ревизора. "
+    "Для каждого ответа оператора найди фактические несоответствия (числа, проценты, валюты, НДС/НДФЛ и т.п.). "
+    "Игнорируй стилистику. Верни JSON-массив элементов вида "
+    "{\\\"id\\\": <id>, \\\"needs_edit\\\": true|false, \\\"reason\\\": \\\"...\\\", \\\"snippet\\\": \\\"...\\\"}."
+)
+DETECT_TAIL = "]\nОтветь только JSON-массивом.".encode()
+REWRITE_INSTRUCTION = (
+    "Замени только указанный фрагмент ответа корректной формулировкой, не добавляя новых фактов. "
+    "Верни JSON {\\\"replacement\\\": \\\"...\\\"}."
+)
+
+
+@st.cache_resource(show_spinner=False)
+def build_openai_client() -> OpenAI:
+    # One client (and its connection pool) per server process; a failure is
+    # not cached, so the next rerun tries again.
+    return OpenAI()
 
 
 def get_openai_client() -> OpenAI | None:
-    global _openai_client
-    if _openai_client is not None:
-        return _openai_client
     try:
-        _openai_client = OpenAI()
+        return build_openai_client()
     except Exception as exc:  # noqa: BLE001
         st.error(f"Не удалось инициализировать OpenAI клиента: {exc}")
         return None
-    return _openai_client
 
 
-def call_openai(messages: List[Dict[str, str]], temperature: float | None = None) -> str | None:
-    client = get_openai_client()
+def call_openai(
+    messages: List[Dict[str, str]],
+    temperature: float | None = None,
+    client: OpenAI | None = None,
+) -> str | None:
+    # Pool threads pass the client in: they have no Streamlit script context.
+    client = client or get_openai_client()
     if client is None:
         return None
     kwargs: Dict[str, Any] = {
@@ -57,41 +88,77 @@ def call_openai(messages: List[Dict[str, str]], temperature: float | None = None
 
 
 def extract_json_structure(text: str) -> Any | None:
+    """First complete JSON array/object in a model reply, ignoring prose around it."""
     text = (text or "").strip()
     if not text:
         return None
     try:
-        return json.loads(text)
-    except JSONDecodeError:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
         pass
-    start = text.find("[")
-    end = text.rfind("]")
-    if start != -1 and end != -1 and end > start:
-        snippet = text[start : end + 1]
-        try:
-            return json.loads(snippet)
-        except JSONDecodeError:
-            pass
-    start = text.find("{")
-    end = text.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        snippet = text[start : end + 1]
+    # raw_decode stops at the end of the first complete value, so trailing prose
+    # costs nothing and each candidate start is lexed only as far as it is valid.
+    # Only objects and lists of objects count, so prose such as "see [1]" is skipped.
+    for match in JSON_START_RE.finditer(text):
         try:
-            return json.loads(snippet)
-        except JSONDecodeError:
-            pass
+            value = JSON_DECODER.raw_decode(text, match.start())[0]
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict) or (isinstance(value, list) and all(isinstance(item, dict) for item in value)):
+            return value
     return None
 
 
-def chunk_list(items: List[Any], size: int) -> List[List[Any]]:
-    return [items[i : i + size] for i in range(0, len(items), size)]
+def pack_payload_chunks(encoded: List[bytes], max_items: int, max_tokens: int) -> List[range]:
+    """Greedily split encoded payload items into consecutive ranges of at most max_items / ~max_tokens."""
+    chunks: List[range] = []
+    start = 0
+    tokens = 0
+    for pos, item in enumerate(encoded):
+        # ~4 UTF-8 bytes per token is a conservative guess (Cyrillic is 2 bytes a character).
+        cost = len(item) // 4
+        if pos > start and (pos - start >= max_items or tokens + cost > max_tokens):
+            chunks.append(range(start, pos))
+            start, tokens = pos, 0
+        tokens += cost
+    if start < len(encoded):
+        chunks.append(range(start, len(encoded)))
+    return chunks
+
+
+# A few entries per loader: a save changes mtime_ns, and older versions would otherwise stay cached.
+@st.cache_data(show_spinner=False, max_entries=4)
+def read_json_file(path: str, mtime_ns: int) -> Any:
+    """Parsed JSON of `path`, cached across reruns; mtime_ns invalidates it on rewrite."""
+    return read_json(path)
+
+
+def iter_jsonl(path: str | Path) -> Iterator[Dict[str, Any]]:
+    loads = orjson.loads
+    with open(path, "rb", buffering=1 << 20) as handle:
+        for line in handle:
+            # orjson takes the trailing newline as is; isspace() spots blank lines
+            # without the copy strip() makes of every line.
+            if not line.isspace():
+                yield loads(line)
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def read_jsonl_file(path: str, mtime_ns: int) -> List[Dict[str, Any]]:
+    return list(iter_jsonl(path))
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def read_lowered_questions(path: str, mtime_ns: int) -> List[str]:
+    """Lower-cased `question` of each JSONL row, aligned with read_jsonl_file."""
+    return [(row.get("question") or "").lower() for row in iter_jsonl(path)]
 
 
 def load_kb() -> List[Dict[str, Any]]:
     if not KB_PATH.exists():
         st.error(f"Файл {KB_PATH} не найден. Выполните `make kb` перед запуском приложения.")
         st.stop()
-    return json.loads(KB_PATH.read_text(encoding="utf-8"))
+    return read_json_file(str(KB_PATH), KB_PATH.stat().st_mtime_ns)
 
 
 def load_clusters() -> Dict[str, Dict[str, Any]]:
@@ -101,7 +168,7 @@ def load_clusters() -> Dict[str, Dict[str, Any]]:
             "Запустите `make dedup` и `make kb` прежде чем использовать приложение."
         )
         st.stop()
-    clusters = json.loads(DEDUP_PATH.read_text(encoding="utf-8"))
+    clusters = read_json_file(str(DEDUP_PATH), DEDUP_PATH.stat().st_mtime_ns)
     return {cluster["canonical_q"]: cluster for cluster in clusters}
 
 
@@ -109,30 +176,50 @@ def load_nlu_rows() -> List[Dict[str, Any]]:
     if not NLU_PATH.exists():
         st.error(f"Файл {NLU_PATH} не найден. Выполните `make nlu-export` перед проверкой.")
         st.stop()
-    rows: List[Dict[str, Any]] = []
-    with open(NLU_PATH, "r", encoding="utf-8") as handle:
-        for line in handle:
-            line = line.strip()
-            if not line:
-                continue
-            rows.append(json.loads(line))
-    return rows
+    return read_jsonl_file(str(NLU_PATH), NLU_PATH.stat().st_mtime_ns)
+
+
+def load_nlu_questions() -> List[str]:
+    return read_lowered_questions(str(NLU_PATH), NLU_PATH.stat().st_mtime_ns)
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def kb_option_labels(path: str, mtime_ns: int) -> List[str]:
+    return [f"{idx + 1}. {entry['canonical_question']}" for idx, entry in enumerate(read_json_file(path, mtime_ns))]
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_candidate_rows(
+    canonical_question: str,
+    dedup_path: str,
+    dedup_mtime_ns: int,
+    nlu_path: str,
+    nlu_mtime_ns: int,
+) -> List[int]:
+    """find_candidate_rows as of the given file versions; recomputed only when a file changes."""
+    clusters = read_json_file(dedup_path, dedup_mtime_ns)
+    return find_candidate_rows(
+        canonical_question,
+        {cluster["canonical_q"]: cluster for cluster in clusters},
+        read_jsonl_file(nlu_path, nlu_mtime_ns),
+        read_lowered_questions(nlu_path, nlu_mtime_ns),
+    )
 
 
 def save_kb(entries: List[Dict[str, Any]]) -> None:
-    KB_PATH.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json(KB_PATH, entries, indent=True)
 
 
 def save_clusters(cluster_map: Dict[str, Dict[str, Any]]) -> None:
-    clusters = list(cluster_map.values())
-    DEDUP_PATH.write_text(json.dumps(clusters, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json(DEDUP_PATH, list(cluster_map.values()))
 
 
 def save_nlu_rows(rows: List[Dict[str, Any]]) -> None:
-    with open(NLU_PATH, "w", encoding="utf-8") as handle:
-        for row in rows:
-            handle.write(json.dumps(row, ensure_ascii=False))
-            handle.write("\n")
+    # Serialized up front and written in one call, in the same compact form
+    # as 35_export_nlu_pairs.py.
+    data = b"".join(orjson.dumps(row) + b"\n" for row in rows)
+    with open(NLU_PATH, "wb") as handle:
+        handle.write(data)
 
 
 def append_correction_log(record: Dict[str, Any]) -> None:
@@ -140,54 +227,83 @@ def append_correction_log(record: Dict[str, Any]) -> None:
     last_record = read_last_log_entry()
     if last_record == record:
         return
-    with open(CORR_PATH, "a", encoding="utf-8") as handle:
-        handle.write(json.dumps(record, ensure_ascii=False))
-        handle.write("\n")
+    append_jsonl(CORR_PATH, record)
+
+
+@st.cache_data(show_spinner=False, ttl=60)
+def audio_inventory(audio_dir: str = "audio") -> set[str]:
+    """Conversation ids with a .wav file, from one directory listing per minute."""
+    try:
+        with os.scandir(audio_dir) as it:
+            return {entry.name[:-4] for entry in it if entry.name.endswith(".wav") and entry.is_file()}
+    except FileNotFoundError:
+        return set()
 
 
 def list_audio_sources(conversation_ids: List[str]) -> List[str]:
-    sources: List[str] = []
-    for conv_id in conversation_ids:
-        audio_fp = Path("audio") / f"{conv_id}.wav"
-        if audio_fp.exists():
-            sources.append(str(audio_fp))
-        else:
-            sources.append(f"(нет файла) {conv_id}")
-    return sources
+    available = audio_inventory()
+    return [
+        f"audio/{conv_id}.wav" if conv_id in available else f"(нет файла) {conv_id}"
+        for conv_id in conversation_ids
+    ]
+
+
+def read_last_line(path: Path, block_size: int = 4096) -> bytes:
+    """Last non-empty line of `path`, read backwards from the end block by block."""
+    with open(path, "rb") as handle:
+        pos = handle.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            handle.seek(pos)
+            tail = handle.read(step) + tail
+            stripped = tail.rstrip()
+            if b"\n" in stripped:
+                return stripped.rsplit(b"\n", 1)[1].strip()
+        return tail.strip()
 
 
 def read_last_log_entry() -> Dict[str, Any] | None:
-    if not CORR_PATH.exists():
-        return None
     try:
-        with open(CORR_PATH, "r", encoding="utf-8") as handle:
-            last_line = deque(handle, maxlen=1)[0].strip()
-    except (IndexError, FileNotFoundError):
+        last_line = read_last_line(CORR_PATH)
+    except FileNotFoundError:
         return None
     if not last_line:
         return None
     try:
-        return json.loads(last_line)
-    except json.JSONDecodeError:
+        return orjson.loads(last_line)
+    except orjson.JSONDecodeError:
         return None
 
 
-def load_corrections_for(question: str) -> List[Dict[str, Any]]:
-    if not CORR_PATH.exists():
-        return []
-    entries: List[Dict[str, Any]] = []
-    with open(CORR_PATH, "r", encoding="utf-8") as handle:
+@st.cache_resource(show_spinner=False, max_entries=1)
+def read_corrections_index(path: str, mtime_ns: int) -> Dict[Any, List[Dict[str, Any]]]:
+    """Correction records grouped by canonical_question, in log order.
+
+    Rebuilt only when the log changes. A resource cache hands out the same
+    object on every call instead of a copy, so callers must not mutate it.
+    """
+    index: Dict[Any, List[Dict[str, Any]]] = {}
+    with open(path, "rb") as handle:
         for line in handle:
             line = line.strip()
             if not line:
                 continue
             try:
-                record = json.loads(line)
-            except json.JSONDecodeError:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
                 continue
-            if record.get("canonical_question") == question:
-                entries.append(record)
-    return entries
+            index.setdefault(record.get("canonical_question"), []).append(record)
+    return index
+
+
+def load_corrections_for(question: str) -> List[Dict[str, Any]]:
+    try:
+        mtime_ns = CORR_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+    return list(read_corrections_index(str(CORR_PATH), mtime_ns).get(question, []))
 
 
 def find_last_correction(question: str) -> Dict[str, Any] | None:
@@ -198,6 +314,10 @@ def find_last_correction(question: str) -> Dict[str, Any] | None:
     return None
 
 
+def normalize_answer(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", (text or "").strip()).lower()
+
+
 def detect_inconsistencies(
     rows: List[Dict[str, Any]],
     canonical_answer: str,
@@ -210,29 +330,46 @@ def detect_inconsistencies(
     if not rows or not OPENAI_READY:
         return results
 
-    instruction = (
-        "У тебя есть канонический ответ и комментарий ревизора. "
-        "Для каждого ответа оператора найди фактические несоответствия (числа, проценты, валюты, НДС/НДФЛ и т.п.). "
-        "Игнорируй стилистику. Верни JSON-массив элементов вида "
-        "{\\\"id\\\": <id>, \\\"needs_edit\\\": true|false, \\\"reason\\\": \\\"...\\\", \\\"snippet\\\": \\\"...\\\"}."
-    )
+    # An answer that already reads as the canonical text has nothing to fix;
+    # it is not worth the tokens or a place in a chunk.
+    canonical_norm = normalize_answer(canonical_answer)
+    to_check = []
+    for row in rows:
+        if normalize_answer(row["answer"]) == canonical_norm:
+            results[row["idx"]]["reason"] = "matches_canonical"
+        else:
+            to_check.append(row)
+    if not to_check:
+        return results
 
-    for chunk in chunk_list(rows, DETECTION_BATCH_SIZE):
-        payload = [
-            {"id": row["idx"], "question": row["question"], "answer": row["answer"]}
-            for row in chunk
-        ]
-        message = (
-            f"{instruction}\n\n"
-            f"Канонический ответ: {canonical_answer}\n"
-            f"Комментарий ревизора: {comment}\n"
-            f"Ответы операторов: {json.dumps(payload, ensure_ascii=False)}\n"
-            "Ответь только JSON-массивом."
-        )
-        content = call_openai([{"role": "user", "content": message}])
+    payload = [{"id": row["idx"], "question": row["question"], "answer": row["answer"]} for row in to_check]
+    # Every item is encoded once: the bytes size the chunks and are spliced into the prompts.
+    encoded = [orjson.dumps(item) for item in payload]
+    ranges = pack_payload_chunks(encoded, DETECTION_BATCH_SIZE, DETECTION_PROMPT_TOKENS)
+    head = (
+        f"{DETECT_INSTRUCTION}\n\n"
+        f"Канонический ответ: {canonical_answer}\n"
+        f"Комментарий ревизора: {comment}\n"
+        "Ответы операторов: ["
+    ).encode()
+    messages = [(head + b",".join(encoded[span.start : span.stop]) + DETECT_TAIL).decode() for span in ranges]
+    chunks = [payload[span.start : span.stop] for span in ranges]
+    # Fetched on the script thread, so a client error is still shown via st.error.
+    client = get_openai_client()
+    if client is None:
+        contents: List[str | None] = [None] * len(messages)
+    else:
+        with ThreadPoolExecutor(max_workers=OPENAI_WORKERS) as pool:
+            contents = list(
+                pool.map(lambda message: call_openai([{"role": "user", "content": message}], client=client), messages)
+            )
+
+    for chunk, content in zip(chunks, contents):
         parsed = extract_json_structure(content)
         if isinstance(parsed, list):
             for item in parsed:
+                if not isinstance(item, dict):
+                    continue
                 idx = item.get("id")
                 if idx is None or idx not in results:
                     continue
@@ -242,8 +379,8 @@ def detect_inconsistencies(
                     "snippet": item.get("snippet", ""),
                 }
         else:
-            for row in chunk:
-                results[row["idx"]] = {
+            for item in chunk:
+                results[item["id"]] = {
                     "needs_edit": False,
                     "reason": "parse_error",
                     "snippet": "",
@@ -256,22 +393,19 @@ def rewrite_snippet(
     snippet: str,
     canonical_answer: str,
     comment: str,
+    client: OpenAI | None = None,
 ) -> tuple[str, bool, str]:
     if not snippet or not OPENAI_READY:
         return (original_answer, False, "no_snippet")
 
-    instruction = (
-        "Замени только указанный фрагмент ответа корректной формулировкой, не добавляя новых фактов. "
-        "Верни JSON {\\\"replacement\\\": \\\"...\\\"}."
-    )
     message = (
-        f"{instruction}\n\n"
+        f"{REWRITE_INSTRUCTION}\n\n"
         f"Исходный ответ: {original_answer}\n"
         f"Фрагмент: {snippet}\n"
         f"Канонический ответ: {canonical_answer}\n"
         f"Комментарий ревизора: {comment}\n"
     )
-    content = call_openai([{"role": "user", "content": message}])
+    content = call_openai([{"role": "user", "content": message}], client=client)
     parsed = extract_json_structure(content)
     if not isinstance(parsed, dict):
         return (original_answer, False, "parse_error_rewrite")
@@ -280,90 +414,131 @@ def rewrite_snippet(
     if not replacement:
         return (original_answer, False, "empty_rewrite")
 
-    if snippet in original_answer:
-        return (original_answer.replace(snippet, replacement, 1), True, "fixed")
+    pos = original_answer.find(snippet)
+    if pos < 0:
+        return (original_answer, False, "snippet_not_found")
+    return (original_answer[:pos] + replacement + original_answer[pos + len(snippet) :], True, "fixed")
 
-    return (original_answer, False, "snippet_not_found")
 
-
-def detect_inconsistencies(
-    rows: List[Dict[str, Any]],
+def rewrite_snippets(
+    jobs: List[tuple[int, str, str]],
     canonical_answer: str,
     comment: str,
-) -> Dict[int, Dict[str, Any]]:
-    results: Dict[int, Dict[str, Any]] = {
-        row["idx"]: {"needs_edit": False, "reason": "no_change_needed", "snippet": ""}
-        for row in rows
-    }
-    if not rows:
+) -> Dict[int, tuple[str, bool, str]]:
+    """rewrite_snippet for (idx, answer, snippet) jobs, fired in parallel waves.
+
+    Each wave is only as large as the rewrites still allowed under MAX_REWRITES,
+    so exactly the jobs the sequential loop would have reached get a request.
+    """
+    results: Dict[int, tuple[str, bool, str]] = {}
+    if not jobs:
         return results
-    instruction = (
-        "У тебя есть канонический ответ и комментарий ревизора. "
-        "Для каждого ответа оператора найди фактические противоречия (числа, проценты, валюты, НДС/НДФЛ и т.п.). "
-        "Игнорируй стиль. Верни JSON-массив элементов вида {\"id\": ..., \"needs_edit\": ..., \"reason\": ..., \"snippet\": ...}."
-    )
-    for chunk in chunk_list(rows, DETECTION_BATCH_SIZE):
-        payload = [
-            {"id": row["idx"], "question": row["question"], "answer": row["answer"]}
-            for row in chunk
-        ]
-        message = (
-            f"{instruction}\n\n"
-            f"Канонический ответ: {canonical_answer}\n"
-            f"Комментарий ревизора: {comment}\n"
-            f"Ответы операторов: {json.dumps(payload, ensure_ascii=False)}\n"
-            "Ответь только JSON-массивом."
-        )
-        content = call_openai([{"role": "user", "content": message}])
-        parsed = extract_json_structure(content)
-        if isinstance(parsed, list):
-            for item in parsed:
-                idx = item.get("id")
-                if idx is None or idx not in results:
-                    continue
-                results[idx] = {
-                    "needs_edit": bool(item.get("needs_edit")),
-                    "reason": item.get("reason", ""),
-                    "snippet": item.get("snippet", ""),
-                }
-        else:
-            for row in chunk:
-                results[row["idx"]] = {
-                    "needs_edit": False,
-                    "reason": "parse_error",
-                    "snippet": "",
-                }
+    client = get_openai_client()
+    if client is None:
+        return {idx: (answer, False, "parse_error_rewrite") for idx, answer, _ in jobs}
+    succeeded = 0
+    pos = 0
+    with ThreadPoolExecutor(max_workers=OPENAI_WORKERS) as pool:
+        while pos < len(jobs) and succeeded < MAX_REWRITES:
+            wave = jobs[pos : pos + MAX_REWRITES - succeeded]
+            pos += len(wave)
+            outcomes = pool.map(
+                lambda job: rewrite_snippet(job[1], job[2], canonical_answer, comment, client),
+                wave,
+            )
+            for (idx, _, _), outcome in zip(wave, outcomes):
+                results[idx] = outcome
+                succeeded += outcome[1]
     return results
 
 
-
-def update_insights_pair(call_id: str, pair_index: int, new_answer: str) -> bool:
+def update_insights_pairs(call_id: str, updates: List[tuple[int, str]]) -> int:
+    """Set answers of several (pair_index, new_answer) pairs in one read/write of the call's insight file."""
     path = INSIGHTS_DIR / f"{call_id}.json"
-    if not path.exists():
-        return False
-    data = json.loads(path.read_text(encoding="utf-8"))
+    if not updates or not path.exists():
+        return 0
+    data = orjson.loads(path.read_bytes())
     qa_pairs = data.get("verbatim_QA_pairs") or []
-    idx = pair_index - 1
-    if 0 <= idx < len(qa_pairs):
-        qa_pairs[idx]["a"] = new_answer
-        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-        return True
-    return False
+    changed = 0
+    for pair_index, new_answer in updates:
+        idx = pair_index - 1
+        if 0 <= idx < len(qa_pairs):
+            qa_pairs[idx]["a"] = new_answer
+            changed += 1
+    if changed:
+        write_json(path, data)
+    return changed
+
+
+def apply_insights_updates(updates: Dict[str, List[tuple[int, str]]]) -> None:
+    # One file per call, so the read/modify/write cycles are independent and can overlap.
+    if len(updates) <= 1:
+        for call_id, pairs in updates.items():
+            update_insights_pairs(call_id, pairs)
+        return
+    with ThreadPoolExecutor(max_workers=min(8, len(updates))) as pool:
+        list(pool.map(update_insights_pairs, updates.keys(), updates.values()))
 
 
-def regenerate_nlu_export() -> bool:
-    try:
-        subprocess.run(
+@st.cache_resource(show_spinner=False)
+def nlu_export_state() -> Dict[str, Any]:
+    # Process-wide: every session writes the same nlu_output, so one export at a time.
+    return {"lock": threading.Lock(), "thread": None, "pending": False, "error": None}
+
+
+def _run_nlu_export(state: Dict[str, Any]) -> None:
+    while True:
+        result = subprocess.run(
             ["make", "nlu-export"],
-            check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
         )
-        return True
-    except subprocess.CalledProcessError as exc:
-        st.error(f"Не удалось обновить nlu_output: {exc.stderr or exc.stdout}")
-        return False
+        with state["lock"]:
+            if result.returncode != 0:
+                state["error"] = result.stderr or result.stdout
+            # Corrections saved while this run was going need one more run,
+            # however many of them there were.
+            if not state["pending"]:
+                state["thread"] = None
+                return
+            state["pending"] = False
+
+
+def regenerate_nlu_export() -> bool:
+    """Start `make nlu-export` in the background, or queue one rerun if it is already going."""
+    state = nlu_export_state()
+    with state["lock"]:
+        if state["thread"] is not None:
+            state["pending"] = True
+            return True
+        state["thread"] = threading.Thread(target=_run_nlu_export, args=(state,), daemon=True)
+        state["thread"].start()
+    return True
+
+
+def wait_for_nlu_export() -> bool:
+    """Block until a running export finishes; True if there was one to wait for."""
+    state = nlu_export_state()
+    waited = False
+    while True:
+        with state["lock"]:
+            thread = state["thread"]
+        if thread is None:
+            return waited
+        waited = True
+        thread.join()
+
+
+def show_nlu_export_status() -> None:
+    state = nlu_export_state()
+    with state["lock"]:
+        running = state["thread"] is not None
+        error, state["error"] = state["error"], None
+    if error:
+        st.error(f"Не удалось обновить nlu_output: {error}")
+    if running:
+        st.info("nlu_output обновляется в фоне…")
 
 
 def undo_last_correction(
@@ -397,19 +572,26 @@ def undo_last_correction(
 
     prev_rows = record.get("previous_rows") or []
     note = f"Откат правки от {record.get('reviewed_at')} ({record.get('reviewer')})"
+    # One pass over nlu_rows instead of one per restored row; the first row with
+    # a given (call_id, pair_index) wins, as the old scan's break did.
+    row_index: Dict[tuple[Any, Any], Dict[str, Any]] = {}
+    if prev_rows:
+        for row in nlu_rows:
+            row_index.setdefault((row.get("call_id"), row.get("pair_index")), row)
+    insights_updates: Dict[str, List[tuple[int, str]]] = {}
     for prev in prev_rows:
         call_id = prev.get("call_id")
         pair_index = prev.get("pair_index")
         prev_answer_text = prev.get("previous_answer", "")
         if not call_id or not pair_index:
             continue
-        for row in nlu_rows:
-            if row.get("call_id") == call_id and row.get("pair_index") == pair_index:
-                row["answer"] = prev_answer_text
-                row["needs_review"] = True
-                row["review_notes"] = note
-                update_insights_pair(call_id, pair_index, prev_answer_text)
-                break
+        row = row_index.get((call_id, pair_index))
+        if row is not None:
+            row["answer"] = prev_answer_text
+            row["needs_review"] = True
+            row["review_notes"] = note
+            insights_updates.setdefault(call_id, []).append((pair_index, prev_answer_text))
+    apply_insights_updates(insights_updates)
     if prev_rows:
         save_nlu_rows(nlu_rows)
         regenerate_nlu_export()
@@ -428,6 +610,7 @@ def find_candidate_rows(
     canonical_question: str,
     cluster_map: Dict[str, Dict[str, Any]],
     nlu_rows: List[Dict[str, Any]],
+    questions_lc: List[str] | None = None,
 ) -> List[int]:
     cluster = cluster_map.get(canonical_question)
     if not cluster:
@@ -438,17 +621,20 @@ def find_candidate_rows(
         canonical_question.lower(),
         *(phrase.lower() for phrase in cluster.get("near_duplicates", []) if phrase),
     }
+    near_phrases.discard("")
+    # All phrases in one alternation: a single C-level scan per question instead
+    # of one `in` test per phrase. Longest first, though any hit is enough.
+    pattern = (
+        re.compile("|".join(re.escape(phrase) for phrase in sorted(near_phrases, key=len, reverse=True)))
+        if near_phrases
+        else None
+    )
+    if questions_lc is None or len(questions_lc) != len(nlu_rows):
+        questions_lc = [(row.get("question") or "").lower() for row in nlu_rows]
 
     indices: List[int] = []
     for idx, row in enumerate(nlu_rows):
-        include = False
-        if row.get("call_id") in call_ids:
-            include = True
-        else:
-            question = (row.get("question") or "").lower()
-            if any(phrase and phrase in question for phrase in near_phrases):
-                include = True
-        if include:
+        if row.get("call_id") in call_ids or (pattern is not None and pattern.search(questions_lc[idx])):
             indices.append(idx)
     return indices
 
@@ -508,7 +694,17 @@ def update_records(
         )
 
     detection_map = detect_inconsistencies(batch_rows, new_answer, comment)
+    rewrites = rewrite_snippets(
+        [
+            (idx, nlu_rows[idx].get("answer") or "", detection_map[idx]["snippet"])
+            for idx in selected_row_indices
+            if detection_map.get(idx, {}).get("needs_edit") and detection_map[idx].get("snippet")
+        ],
+        new_answer,
+        comment,
+    )
     rewrites_done = 0
+    insights_updates: Dict[str, List[tuple[int, str]]] = {}
     for idx in selected_row_indices:
         row = nlu_rows[idx]
         if rewrites_done >= MAX_REWRITES:
@@ -542,12 +738,7 @@ def update_records(
 
         if needs_edit and snippet:
             if rewrites_done < MAX_REWRITES:
-                revised_answer, changed_flag, rewrite_reason = rewrite_snippet(
-                    original_answer,
-                    snippet,
-                    new_answer,
-                    comment,
-                )
+                revised_answer, changed_flag, rewrite_reason = rewrites[idx]
                 needs_edit = changed_flag
                 llm_reason = rewrite_reason
                 rewrites_done += 1 if changed_flag else 0
@@ -568,7 +759,7 @@ def update_records(
             row["needs_review"] = False
             row["review_notes"] = note
             if call_id and pair_index:
-                update_insights_pair(call_id, pair_index, revised_answer)
+                insights_updates.setdefault(call_id, []).append((pair_index, revised_answer))
             updated_rows.append(
                 {
                     "call_id": call_id,
@@ -589,6 +780,7 @@ def update_records(
                 "reason": llm_reason,
             }
         )
+    apply_insights_updates(insights_updates)
     if updated_rows:
         save_nlu_rows(nlu_rows)
         regenerate_nlu_export()
@@ -648,11 +840,9 @@ def main() -> None:
     kb_entries = load_kb()
     cluster_map = load_clusters()
     nlu_rows = load_nlu_rows()
+    show_nlu_export_status()
 
-    options = [
-        f"{idx + 1}. {entry['canonical_question']}"
-        for idx, entry in enumerate(kb_entries)
-    ]
+    options = kb_option_labels(str(KB_PATH), KB_PATH.stat().st_mtime_ns)
     selected_idx = st.sidebar.selectbox(
         "Вопрос (canonical_question)",
         options=list(range(len(kb_entries))),
@@ -696,6 +886,9 @@ def main() -> None:
                 if any(r.get("type") == "corrected" for r in correction_history):
                     if st.button("Отменить последнюю правку"):
                         try:
+                            # An export in flight would replace nlu_pairs.jsonl after us; restore onto its result.
+                            if wait_for_nlu_export():
+                                nlu_rows = load_nlu_rows()
                             undo_entry = undo_last_correction(
                                 entry["canonical_question"],
                                 kb_entries,
@@ -775,10 +968,12 @@ def main() -> None:
         comment = st.text_area("Комментарий / что не так", height=120)
         submit_fix = st.form_submit_button("Сохранить исправление")
 
-    candidate_indices = find_candidate_rows(
+    candidate_indices = cached_candidate_rows(
         entry["canonical_question"],
-        cluster_map,
-        nlu_rows,
+        str(DEDUP_PATH),
+        DEDUP_PATH.stat().st_mtime_ns,
+        str(NLU_PATH),
+        NLU_PATH.stat().st_mtime_ns,
     )
     if candidate_indices:
         st.markdown("### Связанные Q&A (будут обновлены автоматически)")
@@ -804,6 +999,15 @@ def main() -> None:
 
         try:
             with st.spinner("Применяем исправление и обновляем связанные ответы..."):
+                # An export in flight would replace nlu_pairs.jsonl after us; apply the fix to its result.
+                if wait_for_nlu_export():
+                    nlu_rows = load_nlu_rows()
+                    candidate_indices = find_candidate_rows(
+                        entry["canonical_question"],
+                        cluster_map,
+                        nlu_rows,
+                        load_nlu_questions(),
+                    )
                 log_entry = update_records(
                     kb_entries,
                     selected_idx,
@@ -823,12 +1027,3 @@ def main() -> None:
 
 if __name__ == "__main__":
     main()
-def list_audio_sources(conversation_ids: List[str]) -> List[str]:
-    sources: List[str] = []
-    for conv_id in conversation_ids:
-        potential = Path("audio") / f"{conv_id}.wav"
-        if potential.exists():
-            sources.append(str(potential))
-        else:
-            sources.append(f"(нет файла) {conv_id}")
-    return sources
@@ -1,36 +1,197 @@
+import hashlib
 import os
-import json
+import mmap
 import orjson
-import re
+import threading
 from pathlib import Path
-from typing import Any, Dict, Iterable, List
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List
+
+# Below this size a plain read() is cheaper than setting up and tearing down a mapping.
+MMAP_MIN_BYTES = 64 * 1024
+AUDIO_EXTS = (".wav", ".mp3", ".m4a", ".flac")
+# Both common spellings, so most names match without lowering a copy first.
+AUDIO_EXTS_CASED = AUDIO_EXTS + tuple(ext.upper() for ext in AUDIO_EXTS)
+# write_json option masks keyed by (indent, numpy). Plain payloads are parsed JSON and
+# always have str keys; only library output (numpy=True) may need non-str keys.
+LIBRARY_OPT = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+DUMP_OPTS = {
+    (False, False): 0,
+    (True, False): orjson.OPT_INDENT_2,
+    (False, True): LIBRARY_OPT,
+    (True, True): LIBRARY_OPT | orjson.OPT_INDENT_2,
+}
+APPEND_OPT = orjson.OPT_APPEND_NEWLINE
 
 def read_json(path: str | Path) -> dict:
     with open(path, "rb") as f:
-        return orjson.loads(f.read())
+        if os.fstat(f.fileno()).st_size < MMAP_MIN_BYTES:
+            return orjson.loads(f.read())
+        # orjson parses straight from the page cache; no intermediate bytes copy.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+            return orjson.loads(view)
+
+def read_json_many(paths: Iterable[str | Path], workers: int = 16) -> Iterator[Any]:
+    """read_json over many files on a thread pool; results come back in input order."""
+    # A bounded readahead window overlaps the reads without loading every file at once.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window: deque = deque()
+        for path in paths:
+            window.append(pool.submit(read_json, path))
+            if len(window) >= workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+def _same_bytes(path: Path, data: bytes) -> bool:
+    # Re-runs mostly reproduce the same output; a size check and one read are
+    # cheaper than rewriting and renaming, and the file keeps its mtime.
+    try:
+        with open(path, "rb") as f:
+            return os.fstat(f.fileno()).st_size == len(data) and f.read() == data
+    except OSError:
+        return False
+
+def write_json(path: str | Path, obj: Any, *, indent: bool = False, numpy: bool = False) -> None:
+    """Compact by default; indent=True for files people read or diff by hand,
+    numpy=True for library output that may hold numpy values or non-str keys."""
+    path = Path(path)
+    data = orjson.dumps(obj, option=DUMP_OPTS[indent, numpy])
+    if _same_bytes(path, data):
+        return
+    # Written beside the target and renamed over it: an interrupted run never
+    # leaves a truncated file that a resume would then skip as done.
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        f = open(tmp, "wb", buffering=0)
+    except FileNotFoundError:
+        # Only the first write into a new directory pays for creating it.
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(tmp, "wb", buffering=0)
+    try:
+        # Unbuffered: the payload is already one contiguous buffer, so it goes to the
+        # kernel directly; a raw write may be short, hence the loop.
+        with f, memoryview(data) as view:
+            while view:
+                view = view[f.write(view):]
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
 
-def write_json(path: str | Path, obj: Any) -> None:
-    os.makedirs(Path(path).parent, exist_ok=True)
-    with open(path, "wb") as f:
-        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+def write_json_many(
+    items: Iterable[tuple[str | Path, Any]],
+    workers: int = 16,
+    *,
+    indent: bool = False,
+    numpy: bool = False,
+) -> None:
+    """write_json for many (path, obj) pairs on a thread pool; returns once all are written."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(write_json, path, obj, indent=indent, numpy=numpy) for path, obj in items]:
+            future.result()
+
+def append_jsonl(path: str | Path, obj: Any) -> None:
+    """Append obj as one JSON line."""
+    data = orjson.dumps(obj, option=APPEND_OPT)
+    # One unbuffered O_APPEND write per record, so lines from concurrent writers never interleave.
+    with open(path, "ab", buffering=0) as f:
+        f.write(data)
+
+def _scan_names(in_dir: str | Path) -> List[str]:
+    # Plain names straight from scandir, without a Path per entry; a missing
+    # directory lists as empty, as Path.glob does.
+    try:
+        with os.scandir(in_dir) as it:
+            return [e.name for e in it]
+    except FileNotFoundError:
+        return []
 
 def list_audio(in_dir: str | Path) -> List[Path]:
-    exts = {".wav", ".mp3", ".m4a", ".flac"}
-    return [p for p in Path(in_dir).glob("*") if p.suffix.lower() in exts]
+    root = Path(in_dir)
+    try:
+        with os.scandir(root) as it:
+            return [
+                root / e.name
+                for e in it
+                # A dot past the first character, as Path.suffix requires, so a bare
+                # ".wav" has no suffix; directories named like audio are skipped.
+                if (e.name.endswith(AUDIO_EXTS_CASED) or e.name.lower().endswith(AUDIO_EXTS))
+                and e.name.rfind(".") > 0
+                and e.is_file()
+            ]
+    except FileNotFoundError:
+        return []
+
+def iter_files(in_dir: str | Path, suffix: str) -> Iterator[Path]:
+    """Files in directory order, for consumers that neither sort nor index them."""
+    root = Path(in_dir)
+    try:
+        with os.scandir(root) as it:
+            for e in it:
+                if e.name.endswith(suffix) and e.is_file():
+                    yield root / e.name
+    except FileNotFoundError:
+        return
 
 def list_files(in_dir: str | Path, suffix: str) -> List[Path]:
-    return sorted(Path(in_dir).glob(f"*{suffix}"))
+    root = Path(in_dir)
+    return [root / n for n in sorted(_scan_names(root)) if n.endswith(suffix)]
 
 def normalize_text(s: str) -> str:
-    s = s.strip()
-    s = re.sub(r"\s+", " ", s)
-    return s
+    # str.split() strips and collapses the same whitespace set as \s, without the regex engine.
+    return " ".join(s.split())
 
-def should_skip(path: str | Path, overwrite: bool) -> bool:
-    return Path(path).exists() and not overwrite
+def existing_names(in_dir: str | Path) -> set[str]:
+    """Entry names of in_dir from one scandir, for should_skip over many outputs."""
+    return set(_scan_names(in_dir))
 
-def chunked(items: Iterable[Path], size: int) -> List[List[Path]]:
-    collection = list(items)
+def should_skip(path: str | Path, overwrite: bool, *, existing: set[str] | None = None) -> bool:
+    if overwrite:
+        return False
+    # `existing` is existing_names() of path's directory: a set lookup instead of a stat.
+    if existing is not None:
+        return os.path.basename(path) in existing
+    return os.path.exists(path)
+
+def chunked(items: Iterable[Path], size: int) -> Iterator[List[Path]]:
+    # Lazy: only the chunk being yielded is held, not the whole input.
     if size <= 0:
-        return [collection]
-    return [collection[i : i + size] for i in range(0, len(collection), size)]
+        yield list(items)
+        return
+    it = iter(items)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+class ResponseCache:
+    """Content-addressed store of LLM replies, so unchanged inputs skip the API on re-runs."""
+
+    def __init__(self, cache_dir: str | Path | None) -> None:
+        self.dir = Path(cache_dir) if cache_dir else None
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        if self.dir is None:
+            return None
+        try:
+            return (self.dir / f"{key}.txt").read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, content: str) -> None:
+        if self.dir is None:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.dir / f"{key}.txt"
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(content, encoding="utf-8")
+        os.replace(tmp, path)